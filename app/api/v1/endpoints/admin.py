@@ -0,0 +1,138 @@
+"""
+Admin endpoints
+"""
+import json
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse
+
+from app.core.config import settings
+from app.core.dependencies import get_admin_user, get_repo
+from app.core.profiling import list_profiles, get_profile_path
+from app.db.models import User
+from app.db.session import get_pool_stats
+from app.repository.postgres import DatabaseRepo
+from app.schemas.analytics import AnalyticsResponse
+from app.schemas.soil import ModelActivateRequest
+from app.services.analytics import build_buckets
+from app.services.inference_limiter import get_inference_limiter
+from app.services.ml_service import get_ml_service
+
+router = APIRouter()
+
+
+@router.get("/profiles")
+async def get_profiles(
+    limit: int = 50,
+    admin: User = Depends(get_admin_user)
+):
+    """
+    List captured request profiles (newest first)
+
+    Each item contains the request path, status, wall time and the self-time
+    breakdown by library (tensorflow, numpy, PIL, database, app, other).
+    """
+    return {"profiles": list_profiles(limit)}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    admin: User = Depends(get_admin_user)
+):
+    """Get profile summary with the top functions by cumulative time"""
+    path = get_profile_path(profile_id, ".json")
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@router.get("/profiles/{profile_id}/download")
+async def download_profile(
+    profile_id: str,
+    admin: User = Depends(get_admin_user)
+):
+    """Download raw cProfile dump (open with snakeviz or pstats)"""
+    path = get_profile_path(profile_id, ".prof")
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+
+@router.get("/inference")
+async def get_inference_stats(admin: User = Depends(get_admin_user)):
+    """Current inference admission state of this worker process"""
+    return get_inference_limiter().stats()
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats(admin: User = Depends(get_admin_user)):
+    """Connection pool usage of this worker process (primary and read replica)"""
+    return get_pool_stats()
+
+
+@router.get("/analytics", response_model=AnalyticsResponse)
+async def get_analytics(
+    period: Literal["day", "week"] = "week",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    soil_type: str | None = None,
+    admin: User = Depends(get_admin_user),
+    repo: DatabaseRepo = Depends(get_repo)
+):
+    """
+    Soil type distribution over time across all users
+
+    - period: day or week buckets (weeks start on Monday)
+    - date_from / date_to: bucket range [date_from, date_to)
+    - soil_type: only this soil type
+    - Served from rollup tables, refreshed every ANALYTICS_ROLLUP_INTERVAL seconds
+    """
+    rows = await repo.get_analytics_rollups(period, date_from, date_to, soil_type)
+    return AnalyticsResponse(period=period, buckets=build_buckets(rows))
+
+
+@router.get("/model")
+async def get_model_info(admin: User = Depends(get_admin_user)):
+    """Served model version of this worker and the registry manifest"""
+    ml_service = get_ml_service()
+    fast = getattr(ml_service, "fast", None)
+    return {
+        "loaded_version": ml_service.model_version,
+        "cascade": {
+            "fast_version": fast.version if fast else None,
+            "threshold": settings.CASCADE_THRESHOLD,
+            "counts": getattr(ml_service, "cascade_counts", None),
+        },
+        "manifest": ml_service.registry.read_manifest()
+    }
+
+
+@router.post("/model/activate", status_code=202)
+async def activate_model(
+    data: ModelActivateRequest,
+    background_tasks: BackgroundTasks,
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Activate a registered model version
+
+    - Marks the version active in manifest.json (other workers pick it up
+      via MODEL_WATCH_INTERVAL)
+    - Loads, warms up and swaps it in on this worker in the background
+    """
+    ml_service = get_ml_service()
+    try:
+        ml_service.registry.activate(data.version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Sync function -> выполняется в threadpool после ответа
+    background_tasks.add_task(ml_service.reload, data.version)
+
+    return {"message": "Model reload scheduled", "version": data.version}
@@ -1,9 +1,14 @@
+import hashlib
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 
+from app.core.compression import accepted_encodings, brotli, compress
+from app.core.config import settings
+
 # Определяем базовую директорию проекта (корень проекта)
 BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent.parent
 
@@ -12,56 +17,121 @@ templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 router = APIRouter()
 
+PAGES = [
+    "index.html", "register.html", "login.html", "verify.html", "dashboard.html",
+    "analyze.html", "history.html", "profile.html", "about.html",
+]
+
+
+@dataclass
+class CachedPage:
+    etag: str
+    variants: dict[str, bytes] = field(default_factory=dict)  # "identity" / "gzip" / "br" -> body
+
+
+# Страницы не содержат данных запроса: рендерим один раз, храним готовые байты
+_pages: dict[str, CachedPage] = {}
+
+
+def page_context() -> dict:
+    """Settings the pages need on the client (same for every request)"""
+    return {
+        "upload_config": {
+            "maxDimension": settings.UPLOAD_MAX_DIMENSION,
+            "jpegQuality": settings.UPLOAD_JPEG_QUALITY,
+            "acceptOriginal": settings.UPLOAD_ACCEPT_ORIGINAL,
+        }
+    }
+
+
+def render_page(name: str) -> CachedPage:
+    html = templates.get_template(name).render(**page_context()).encode("utf-8")
+    page = CachedPage(etag=hashlib.sha1(html).hexdigest()[:16])
+    page.variants["identity"] = html
+    page.variants["gzip"] = compress(html, "gzip")
+    if brotli is not None:
+        page.variants["br"] = compress(html, "br")
+    return page
+
+
+def prerender_pages():
+    """Render and compress all template pages (at startup)"""
+    for name in PAGES:
+        _pages[name] = render_page(name)
+
+
+def page_response(request: Request, name: str) -> Response:
+    """Cached page in the best encoding the client accepts, with ETag revalidation"""
+    if not settings.TEMPLATE_CACHE_ENABLED:
+        return templates.TemplateResponse(request, name, page_context())
+
+    page = _pages.get(name)
+    if page is None:
+        page = _pages[name] = render_page(name)
+
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding = next((e for e in ("br", "gzip") if e in accepted and e in page.variants), "identity")
+
+    # Своя ETag на каждое кодирование
+    etag = f'"{page.etag}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(page.variants[encoding], media_type="text/html", headers=headers)
+
 
 @router.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Главная страница - Landing"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return page_response(request, "index.html")
 
 
 @router.get("/register", response_class=HTMLResponse)
 async def register_page(request: Request):
     """Страница регистрации"""
-    return templates.TemplateResponse("register.html", {"request": request})
+    return page_response(request, "register.html")
 
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     """Страница входа"""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return page_response(request, "login.html")
 
 
 @router.get("/verify", response_class=HTMLResponse)
 async def verify_page(request: Request):
     """Страница верификации email"""
-    return templates.TemplateResponse("verify.html", {"request": request})
+    return page_response(request, "verify.html")
 
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard_page(request: Request):
     """Главная страница приложения после входа"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return page_response(request, "dashboard.html")
 
 
 @router.get("/analyze", response_class=HTMLResponse)
 async def analyze_page(request: Request):
     """Страница анализа почвы"""
-    return templates.TemplateResponse("analyze.html", {"request": request})
+    return page_response(request, "analyze.html")
 
 
 @router.get("/history", response_class=HTMLResponse)
 async def history_page(request: Request):
     """Страница истории анализов"""
-    return templates.TemplateResponse("history.html", {"request": request})
+    return page_response(request, "history.html")
 
 
 @router.get("/profile", response_class=HTMLResponse)
 async def profile_page(request: Request):
     """Страница профиля пользователя"""
-    return templates.TemplateResponse("profile.html", {"request": request})
+    return page_response(request, "profile.html")
 
 
 @router.get("/about", response_class=HTMLResponse)
 async def about_page(request: Request):
     """Страница О системе"""
-    return templates.TemplateResponse("about.html", {"request": request})
+    return page_response(request, "about.html")
@@ -1,37 +1,51 @@
 """
 Soil analysis endpoints
 """
+import csv
+import io
+import mimetypes
 import os
-import uuid
-from pathlib import Path
 from datetime import datetime
+from typing import Literal
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
-from app.core.dependencies import get_repo, get_current_user
+from app.core.dependencies import get_repo, get_current_user, get_rate_limiter
 from app.repository.postgres import DatabaseRepo
 from app.db.models import User, SoilAnalysis
-from app.schemas.soil import SoilAnalysisResponse, SoilAnalysisListResponse, UserStatsResponse
+from app.db.session import ReadSessionLocal
+from app.core.config import settings
+from app.schemas.soil import (
+    SoilAnalysisResponse, SoilAnalysisListResponse, UserStatsResponse, BulkDeleteRequest, BulkDeleteResponse,
+    SimilarAnalysesResponse, SimilarAnalysisItem, SoilPrediction, dump_analyses
+)
+from app.core.profiling import profile_in_thread
+from app.services.inference_limiter import get_inference_limiter
+from app.services.rate_limiter import RateLimiter
+from app.services.dashboard_cache import build_stats
 from app.services.ml_service import get_ml_service
+from app.services.preprocessing import FORMAT_EXTENSIONS, image_dhash, read_image_header
+from app.services.storage import content_key, get_storage, release_images
 
 router = APIRouter()
 
-UPLOAD_DIR = Path("uploads")
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 
-async def validate_image(file: UploadFile):
-    """Validate uploaded image"""
-    # Check extension
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
-        )
+async def validate_image(file: UploadFile) -> str:
+    """
+    Validate uploaded image without decoding it
 
+    Size, then magic bytes and header (format, dimensions): non-images,
+    corrupt headers, other formats and decompression bombs are rejected
+    before anything is written to disk or decoded. Returns the extension of
+    the detected format.
+    """
     # Check file size
     file.file.seek(0, os.SEEK_END)
     file_size = file.file.tell()
@@ -43,71 +57,160 @@ async def validate_image(file: UploadFile):
             detail=f"File too large. Max size: {MAX_FILE_SIZE / 1024 / 1024}MB"
         )
 
-    return file_ext
+    # Check format by content, not by the file name
+    header = read_image_header(file.file)
+    if header is None:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    if header.format not in settings.UPLOAD_ALLOWED_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type: {header.format}. Allowed: {', '.join(settings.UPLOAD_ALLOWED_FORMATS)}"
+        )
+
+    # Check dimensions
+    if header.pixels > settings.UPLOAD_MAX_PIXELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image too large: {header.width}x{header.height}. Max: {settings.UPLOAD_MAX_PIXELS / 1_000_000:g} megapixels"
+        )
+    if min(header.width, header.height) < settings.UPLOAD_MIN_DIMENSION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image too small: {header.width}x{header.height}. Min side: {settings.UPLOAD_MIN_DIMENSION}px"
+        )
+
+    return FORMAT_EXTENSIONS[header.format]
 
 
 @router.post("/analyze", response_model=SoilAnalysisResponse)
 async def analyze_soil(
     file: UploadFile = File(...),
+    original: UploadFile | None = File(None),
     current_user: User = Depends(get_current_user),
-    repo: DatabaseRepo = Depends(get_repo)
+    repo: DatabaseRepo = Depends(get_repo),
+    limiter: RateLimiter = Depends(get_rate_limiter)
 ):
     """
     Analyze soil from uploaded image
 
-    - Uploads image
+    - Uploads image (file: the copy downscaled in the browser; original:
+      the full-size photo, only if the user chose to keep it)
+    - Reuses the earlier result for a near-duplicate photo (DUPLICATE_DETECTION)
     - Runs ML model prediction
     - Saves results to database
     - Returns analysis with recommendations
     """
+    await limiter.check("analyze", user=current_user.id)
+
+    # 503 on API-only workers (ML_ENABLED=false), before any work is done
+    ml_service = get_ml_service()
+
     # Validate image
     file_ext = await validate_image(file)
+    if original is not None and not settings.UPLOAD_ACCEPT_ORIGINAL:
+        original = None
+    original_ext = await validate_image(original) if original is not None else None
+
+    # Admission control: reject fast before decoding, touching disk or the model
+    async with get_inference_limiter().slot(current_user.id):
+        content = await file.read()
+
+        # Near-duplicate of an earlier upload (re-compressed, resized, slightly cropped)
+        image_hash = None
+        duplicate = None
+        if settings.DUPLICATE_DETECTION != "off":
+            try:
+                image_hash = await run_in_threadpool(image_dhash, io.BytesIO(content))
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+            duplicate = await repo.find_similar_image(
+                current_user.id, image_hash, settings.DUPLICATE_MAX_DISTANCE, settings.DUPLICATE_LOOKUP_LIMIT
+            )
+
+        reuse = (
+            duplicate is not None
+            and settings.DUPLICATE_DETECTION == "reuse"
+            and duplicate.model_version == (ml_service.model_version or ml_service.registry.active_version())
+        )
 
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save uploaded file
-    try:
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+        # Свежий mtime файла дубликата: GC и release_images не удалят его до коммита нового анализа
+        if reuse and not await run_in_threadpool(get_storage().touch, duplicate.image_path):
+            reuse = False
+
+        if reuse:
+            # Тот же снимок, та же модель: прежний результат и прежний файл, без инференса
+            image_key = duplicate.image_path
+            prediction = SoilPrediction(
+                soil_type=duplicate.soil_type,
+                confidence=duplicate.confidence,
+                description=duplicate.description,
+                characteristics=duplicate.characteristics,
+                recommended_crops=duplicate.recommended_crops,
+                recommendations=duplicate.recommendations,
+                model_version=duplicate.model_version,
+                cascade_stage=duplicate.cascade_stage
+            )
+        else:
+            image_key = content_key(content, file_ext)
+
+            # Save uploaded file (if anything below fails, the storage GC removes it)
+            try:
+                await run_in_threadpool(get_storage().put, image_key, content)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+            # Run ML prediction (in threadpool, so the event loop keeps serving and rejecting)
+            try:
+                prediction = await run_in_threadpool(profile_in_thread, ml_service.predict, io.BytesIO(content))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+    # Оригинал модели не нужен: только сохраняем, после успешного предсказания
+    original_key = None
+    if original is not None:
+        original_content = await original.read()
+        original_key = content_key(original_content, original_ext)
+        try:
+            await run_in_threadpool(get_storage().put, original_key, original_content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
-    # Run ML prediction
-    try:
-        ml_service = get_ml_service()
-        prediction = ml_service.predict(str(file_path))
-    except Exception as e:
-        # Clean up file on prediction failure
-        if file_path.exists():
-            file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    embedding = None
+    if reuse:
+        embedding = duplicate.embedding
+    elif prediction.embedding is not None and settings.SIMILARITY_INDEX_ENABLED:
+        from app.services.similarity_index import encode_embedding
+        embedding = encode_embedding(prediction.embedding)
 
     # Save to database
     try:
         analysis = SoilAnalysis(
             user_id=current_user.id,
             image_filename=file.filename,
-            image_path=str(file_path),
+            image_path=image_key,
+            original_image_path=original_key,
             soil_type=prediction.soil_type,
             confidence=prediction.confidence,
             description=prediction.description,
             characteristics=prediction.characteristics,
             recommended_crops=prediction.recommended_crops,
             recommendations=prediction.recommendations,
+            model_version=prediction.model_version,
+            cascade_stage=prediction.cascade_stage,
+            embedding=embedding,
+            image_hash=image_hash,
+            duplicate_of=duplicate.id if duplicate is not None else None,
             created_at=datetime.utcnow()
         )
 
         await repo.save_soil_analysis(analysis)
 
+        if embedding is not None and settings.SIMILARITY_INDEX_ENABLED:
+            _index_analysis(analysis.id, current_user.id, embedding)
+
         return SoilAnalysisResponse.model_validate(analysis)
 
     except Exception as e:
-        # Clean up file on database failure
-        if file_path.exists():
-            file_path.unlink()
         raise HTTPException(status_code=500, detail=f"Failed to save analysis: {str(e)}")
 
 
@@ -124,12 +227,75 @@ async def get_analysis_history(
     - limit: Maximum number of results (default: 50)
     - offset: Number of results to skip (default: 0)
     """
-    analyses = await repo.get_user_soil_analyses(current_user.id, limit, offset)
+    # Первая страница дашборда - из кэша, без запросов к Postgres
+    if repo.dashboard_cache is not None and offset == 0 and limit <= settings.DASHBOARD_CACHE_SIZE:
+        dashboard = await repo.dashboard_cache.get_or_build(repo, current_user.id)
+        return Response(
+            orjson.dumps({"analyses": dashboard["recent"][:limit], "total": dashboard["total"]}),
+            media_type="application/json"
+        )
+
+    rows = await repo.get_user_soil_analysis_rows(current_user.id, limit, offset)
     total = await repo.count_user_analyses(current_user.id)
 
-    return SoilAnalysisListResponse(
-        analyses=[SoilAnalysisResponse.model_validate(a) for a in analyses],
-        total=total
+    # Строки без ORM-объектов, вся страница валидируется одним вызовом TypeAdapter
+    return Response(
+        orjson.dumps({"analyses": dump_analyses(rows), "total": total}),
+        media_type="application/json"
+    )
+
+
+EXPORT_FIELDS = [
+    "id", "created_at", "soil_type", "confidence", "model_version", "image_filename",
+    "description", "characteristics", "recommended_crops", "recommendations"
+]
+
+
+async def _export_rows(user_id: int, export_format: str):
+    """Encode the user's history chunk by chunk; memory does not depend on history size"""
+    # Своя сессия (реплики, если есть): сессия из зависимости может закрыться до окончания стриминга
+    async with ReadSessionLocal() as session:
+        repo = DatabaseRepo(session)
+
+        if export_format == "csv":
+            header = io.StringIO()
+            csv.writer(header).writerow(EXPORT_FIELDS)
+            yield header.getvalue()
+
+        async for rows in repo.stream_user_soil_analyses(user_id):
+            chunk = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(chunk)
+                for row in rows:
+                    writer.writerow([
+                        row["created_at"].isoformat() if field == "created_at" else row[field]
+                        for field in EXPORT_FIELDS
+                    ])
+            else:
+                for row in rows:
+                    chunk.write(orjson.dumps(dict(row)).decode())
+                    chunk.write("\n")
+            yield chunk.getvalue()
+
+
+@router.get("/history/export")
+async def export_analysis_history(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Export the full analysis history of the current user
+
+    - format: ndjson (default) or csv
+    - Rows are streamed from a server-side cursor, newest first
+    """
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    filename = f"soil_history_{datetime.utcnow():%Y%m%d}.{format}"
+
+    return StreamingResponse(
+        _export_rows(current_user.id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
@@ -147,45 +313,17 @@ async def get_user_stats(
     - Most common soil type
     - Latest analysis date
     """
-    from app.schemas.soil import SoilTypeStats
-    from collections import Counter
-
-    # Get all user analyses
-    analyses = await repo.get_user_soil_analyses(current_user.id, limit=1000, offset=0)
-    total = len(analyses)
-
-    if total == 0:
-        return UserStatsResponse(
-            total_analyses=0,
-            soil_types_breakdown=[],
-            most_common_type=None,
-            latest_analysis_date=None
-        )
-
-    # Count soil types
-    soil_type_counts = Counter(a.soil_type for a in analyses)
+    if repo.dashboard_cache is not None:
+        dashboard = await repo.dashboard_cache.get_or_build(repo, current_user.id)
+        return Response(orjson.dumps(dashboard["stats"]), media_type="application/json")
 
-    # Calculate breakdown with percentages
-    breakdown = [
-        SoilTypeStats(
-            soil_type=soil_type,
-            count=count,
-            percentage=round((count / total) * 100, 1)
-        )
-        for soil_type, count in soil_type_counts.most_common()
-    ]
+    soil_type_counts = await repo.count_user_analyses_by_soil_type(current_user.id)
+    latest = await repo.get_user_soil_analyses(current_user.id, limit=1, offset=0)
 
-    # Get most common type
-    most_common = soil_type_counts.most_common(1)[0][0] if soil_type_counts else None
-
-    # Get latest analysis date
-    latest_date = max(a.created_at for a in analyses) if analyses else None
-
-    return UserStatsResponse(
-        total_analyses=total,
-        soil_types_breakdown=breakdown,
-        most_common_type=most_common,
-        latest_analysis_date=latest_date
+    return build_stats(
+        sum(soil_type_counts.values()),
+        soil_type_counts,
+        latest[0].created_at if latest else None
     )
 
 
@@ -204,53 +342,191 @@ async def get_analysis(
     return SoilAnalysisResponse.model_validate(analysis)
 
 
+def _index_analysis(analysis_id: int, user_id: int, embedding: bytes):
+    """Add a new analysis to the similarity index if this worker has built it"""
+    from app.services.similarity_index import get_similarity_index
+
+    index = get_similarity_index()
+    # Ещё не построенный индекс подтянет строку из БД при первом поиске
+    if index.loaded:
+        index.add(analysis_id, user_id, embedding)
+
+
+@router.get("/analysis/{analysis_id}/similar", response_model=SimilarAnalysesResponse)
+async def get_similar_analyses(
+    analysis_id: int,
+    k: int = Query(5, ge=1, le=50),
+    scope: Literal["user", "global"] = "user",
+    current_user: User = Depends(get_current_user),
+    repo: DatabaseRepo = Depends(get_repo)
+):
+    """
+    Find analyses whose photos look most like this one
+
+    - k: number of results (default: 5)
+    - scope: user (own history, default) or global (all users; other users'
+      analyses are returned without id)
+    - 409 for analyses answered by the fast cascade model: they have no
+      embedding (the index holds only the full model's embedding space)
+    """
+    if not settings.SIMILARITY_INDEX_ENABLED:
+        raise HTTPException(status_code=503, detail="Similarity search is disabled")
+
+    analysis = await repo.get_soil_analysis_by_id(analysis_id, current_user.id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+
+    from app.services.similarity_index import get_similarity_index
+
+    index = get_similarity_index()
+    await index.sync(repo)
+    if not index.contains(analysis_id):
+        if analysis.cascade_stage == "fast":
+            raise HTTPException(
+                status_code=409,
+                detail="Similarity search is not available for analyses answered by the fast cascade model"
+            )
+        raise HTTPException(status_code=404, detail="Analysis has no embedding")
+
+    hits = index.search(analysis_id, k, user_id=current_user.id if scope == "user" else None)
+
+    rows = await repo.get_soil_analyses_by_ids([hit_id for hit_id, _ in hits])
+    results = []
+    for hit_id, similarity in hits:
+        row = rows.get(hit_id)
+        if row is None:
+            # Удалена другим воркером
+            continue
+        results.append(SimilarAnalysisItem(
+            similarity=round(similarity, 4),
+            soil_type=row["soil_type"],
+            confidence=row["confidence"],
+            created_at=row["created_at"],
+            analysis_id=hit_id if row["user_id"] == current_user.id else None
+        ))
+
+    return SimilarAnalysesResponse(analysis_id=analysis_id, scope=scope, results=results)
+
+
+def _released_images(deleted) -> list[str]:
+    return [key for row in deleted for key in (row["image_path"], row["original_image_path"]) if key is not None]
+
+
+def _unindex_analyses(analysis_ids: list[int]):
+    if settings.SIMILARITY_INDEX_ENABLED:
+        from app.services.similarity_index import get_similarity_index
+        index = get_similarity_index()
+        for analysis_id in analysis_ids:
+            index.remove(analysis_id)
+
+
 @router.delete("/analysis/{analysis_id}")
 async def delete_analysis(
     analysis_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     repo: DatabaseRepo = Depends(get_repo)
 ):
     """Delete analysis and associated image"""
-    analysis = await repo.get_soil_analysis_by_id(analysis_id, current_user.id)
+    # Один DELETE ... RETURNING: проверка владельца и ключи файлов за один запрос
+    deleted = await repo.delete_soil_analysis(analysis_id, current_user.id)
 
-    if not analysis:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
 
-    # Delete image file
-    image_path = Path(analysis.image_path)
-    if image_path.exists():
-        try:
-            image_path.unlink()
-        except Exception:
-            pass  # Ignore file deletion errors
+    # Files go after the response, unless another analysis (same content) still points at them
+    background_tasks.add_task(release_images, _released_images([deleted]))
+    _unindex_analyses([analysis_id])
 
-    # Delete from database
-    success = await repo.delete_soil_analysis(analysis_id, current_user.id)
+    return {"message": "Analysis deleted successfully"}
 
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to delete analysis")
 
-    return {"message": "Analysis deleted successfully"}
+@router.post("/history/delete", response_model=BulkDeleteResponse)
+async def delete_analyses(
+    data: BulkDeleteRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    repo: DatabaseRepo = Depends(get_repo)
+):
+    """
+    Delete many analyses of the current user at once
+
+    - ids: analyses to delete (other users' ids are ignored)
+    - created_from / created_to: delete analyses created in [created_from, created_to)
+    - Both given: only the listed ids inside the range
+    """
+    deleted = await repo.delete_soil_analyses(
+        current_user.id,
+        analysis_ids=data.ids,
+        created_from=data.created_from,
+        created_to=data.created_to
+    )
+
+    background_tasks.add_task(release_images, _released_images(deleted))
+    deleted_ids = [row["id"] for row in deleted]
+    _unindex_analyses(deleted_ids)
+
+    return BulkDeleteResponse(deleted=len(deleted_ids), ids=deleted_ids)
+
+
+def _content_disposition(filename: str) -> str:
+    """attachment; filename=... (RFC 5987 for non-ASCII names, e.g. Cyrillic)"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
 
 
 @router.get("/image/{analysis_id}")
 async def get_analysis_image(
     analysis_id: int,
+    original: bool = False,
     current_user: User = Depends(get_current_user),
     repo: DatabaseRepo = Depends(get_repo)
 ):
-    """Get the image for a specific analysis"""
+    """
+    Get the image for a specific analysis
+
+    - original: the full-size photo instead of the analyzed upload (404 if it was not kept)
+    """
     analysis = await repo.get_soil_analysis_by_id(analysis_id, current_user.id)
 
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
 
-    image_path = Path(analysis.image_path)
-    if not image_path.exists():
-        raise HTTPException(status_code=404, detail="Image file not found")
+    image_key = analysis.original_image_path if original else analysis.image_path
+    if image_key is None:
+        raise HTTPException(status_code=404, detail="Original image was not kept")
+
+    storage = get_storage()
+    media_type = mimetypes.guess_type(image_key)[0] or "image/jpeg"
+    # Ключи content-addressed: файл анализа не меняется, браузер может кэшировать
+    headers = {
+        "Content-Disposition": _content_disposition(analysis.image_filename),
+        "Cache-Control": "private, max-age=86400",
+    }
+
+    if settings.IMAGE_DELIVERY == "x-accel":
+        # Владелец проверен, файл отдаёт nginx из internal location (sendfile, без Python)
+        headers["X-Accel-Redirect"] = settings.IMAGE_ACCEL_PREFIX.rstrip("/") + "/" + quote(image_key)
+        return Response(media_type=media_type, headers=headers)
+
+    image_path = storage.local_path(image_key)
+    if image_path is not None:
+        if not image_path.exists():
+            raise HTTPException(status_code=404, detail="Image file not found")
+        if settings.IMAGE_DELIVERY == "x-sendfile":
+            headers["X-Sendfile"] = str(image_path.resolve())
+            return Response(media_type=media_type, headers=headers)
+        return FileResponse(image_path, media_type=media_type, headers=headers)
 
-    return FileResponse(
-        image_path,
-        media_type="image/jpeg",
-        filename=analysis.image_filename
+    try:
+        stream = await run_in_threadpool(storage.open, image_key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image file not found")
+    return StreamingResponse(
+        iter(lambda: stream.read(64 * 1024), b""),
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(stream.close)
     )
@@ -3,13 +3,14 @@ import secrets
 from fastapi import APIRouter, Depends, HTTPException, Response, Request
 
 from app.core.config import settings
-from app.core.dependencies import get_repo, get_jwt_client, get_email_client, get_redis_client
+from app.core.dependencies import client_ip, get_repo, get_jwt_client, get_email_client, get_redis_client, get_rate_limiter
 from app.core.security import hash_password
 from app.db.models import User
 from app.repository.postgres import DatabaseRepo
 from app.schemas.user import UserRegisterSchema, UserLoginSchema, UserVerifySchema, ResendCodeSchema
 from app.services.email_service import EmailClient
 from app.services.jwt_client import JWTClient
+from app.services.rate_limiter import RateLimiter
 from app.services.redis_client import RedisClient
 
 router = APIRouter()
@@ -17,10 +18,14 @@ router = APIRouter()
 
 @router.post("/register")
 async def register(creds: UserRegisterSchema,
+                   request: Request,
                    repo: DatabaseRepo = Depends(get_repo),
                    email_client: EmailClient = Depends(get_email_client),
-                   redis: RedisClient = Depends(get_redis_client)):
+                   redis: RedisClient = Depends(get_redis_client),
+                   limiter: RateLimiter = Depends(get_rate_limiter)):
     """Регистрация нового пользователя"""
+    await limiter.check("register", ip=client_ip(request), email=creds.email)
+
     # Проверяем существование пользователя
     if await repo.check_user_exists(creds.email):
         raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
@@ -53,10 +58,15 @@ async def register(creds: UserRegisterSchema,
 
 @router.post("/login")
 async def login(creds: UserLoginSchema,
+                request: Request,
                 response: Response,
                 repo: DatabaseRepo = Depends(get_repo),
-                jwt_client: JWTClient = Depends(get_jwt_client)):
+                jwt_client: JWTClient = Depends(get_jwt_client),
+                limiter: RateLimiter = Depends(get_rate_limiter)):
     """Вход в систему"""
+    # До bcrypt: ограничиваем перебор паролей
+    await limiter.check("login", ip=client_ip(request), email=creds.email)
+
     user = await repo.authenticate_user(creds.email, creds.password)
     if not user:
         raise HTTPException(status_code=401, detail="Неверные данные")
@@ -85,8 +95,12 @@ async def login(creds: UserLoginSchema,
 
 @router.post("/verify")
 async def verify(data: UserVerifySchema,
+                 request: Request,
                  redis: RedisClient = Depends(get_redis_client),
-                 repo: DatabaseRepo = Depends(get_repo)):
+                 repo: DatabaseRepo = Depends(get_repo),
+                 limiter: RateLimiter = Depends(get_rate_limiter)):
+    await limiter.check("verify", ip=client_ip(request), email=data.email)
+
     user_code = data.verify_code
     correct_code = await redis.get_verify_code(data.email)
 
@@ -103,9 +117,12 @@ async def verify(data: UserVerifySchema,
 
 @router.post("/resend-code")
 async def resend_code(data: ResendCodeSchema,
+                      request: Request,
                       redis: RedisClient = Depends(get_redis_client),
-                      email_client: EmailClient = Depends(get_email_client)
+                      email_client: EmailClient = Depends(get_email_client),
+                      limiter: RateLimiter = Depends(get_rate_limiter)
                       ):
+    await limiter.check("resend-code", ip=client_ip(request), email=data.email)
 
     verify_code = ''.join(secrets.choice('0123456789') for _ in range(6))
 
@@ -1,9 +1,10 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import users, soil
+from app.api.v1.endpoints import users, soil, admin
 
 router = APIRouter()
 
 # Подключаем все API эндпоинты v1
 router.include_router(users.router, prefix="/users", tags=["users"])
 router.include_router(soil.router, prefix="/soil", tags=["soil"])
+router.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -0,0 +1,242 @@
+"""
+Response compression and precompressed static assets
+
+- CompressionMiddleware: brotli (if the `brotli` package is installed) or
+  gzip for JSON, HTML, CSS, JS, CSV and NDJSON responses, chosen by the
+  client's Accept-Encoding. Streaming responses are compressed chunk by
+  chunk. Responses that already carry Content-Encoding (precompressed
+  static files, cached pages) pass through untouched.
+- PrecompressedStaticFiles: StaticFiles that serves `<file>.br` /
+  `<file>.gz` next to the original when the client accepts them, with
+  Cache-Control for static assets.
+- build_precompressed: writes the `.br` / `.gz` variants once, at build
+  time, at maximum compression levels:
+
+    python -m app.core.compression static
+"""
+import gzip
+import os
+import sys
+import zlib
+from pathlib import Path
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/x-ndjson", "application/javascript",
+    "text/html", "text/css", "text/javascript", "text/csv", "text/plain", "image/svg+xml",
+)
+PRECOMPRESSED_SUFFIXES = (".css", ".js", ".svg", ".json")
+
+# Для ответов на лету - быстрые уровни, для статики при сборке - максимальные
+DYNAMIC_GZIP_LEVEL = 6
+DYNAMIC_BROTLI_QUALITY = 4
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """Content codings allowed by an Accept-Encoding header (q=0 excluded)"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "").rstrip("0").rstrip(".") in ("q=", "q=0"):
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Best coding this process can produce on the fly ("br", "gzip" or None)"""
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """One-shot compression for cached bodies"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=DYNAMIC_BROTLI_QUALITY)
+            self._flush = self._compressor.flush
+            self._finish = self._compressor.finish
+            self._process = self._compressor.process
+        else:
+            # wbits 16+ - формат gzip (заголовок и CRC), а не raw deflate
+            self._compressor = zlib.compressobj(DYNAMIC_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+            self._process = self._compressor.compress
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flush после каждого чанка: стриминг (NDJSON) не должен застревать в буфере компрессора
+        return self._process(data) + self._flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._process(data) + self._finish()
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses text responses with brotli or gzip"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        compressor: _StreamCompressor | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                passthrough = (
+                    "content-encoding" in headers
+                    or content_type not in COMPRESSIBLE_TYPES
+                    or message["status"] in (204, 206, 304)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Заголовки отправим вместе с первым телом: решение зависит от размера
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                if not more_body and len(body) < self.minimum_size:
+                    # Маленький ответ целиком - не сжимаем
+                    headers.add_vary_header("Accept-Encoding")
+                    await send(start_message)
+                    await send(message)
+                    passthrough = True
+                    return
+
+                compressor = _StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    # Сжатое тело - другое представление
+                    headers["etag"] = "W/" + headers["etag"]
+
+                if not more_body:
+                    compressed = compressor.finish(body)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                    return
+                await send(start_message)
+
+            data = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles serving build-time `.br` / `.gz` variants and cache headers"""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+
+        if isinstance(response, FileResponse) and response.status_code == 200:
+            request_headers = Headers(scope=scope)
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            # Готовый .br отдаётся и без пакета brotli: сжимать ничего не нужно
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if encoding not in accepted:
+                    continue
+                variant = Path(f"{response.path}{suffix}")
+                try:
+                    variant_stat = variant.stat()
+                except FileNotFoundError:
+                    continue
+                if variant_stat.st_mtime < os.stat(response.path).st_mtime:
+                    # Исходник изменён после сборки - вариант устарел
+                    continue
+
+                response = FileResponse(
+                    variant,
+                    media_type=response.media_type,
+                    headers={"Content-Encoding": encoding},
+                    stat_result=variant_stat
+                )
+                if self.is_not_modified(response.headers, request_headers):
+                    response = NotModifiedResponse(response.headers)
+                break
+
+        response.headers.setdefault("Cache-Control", f"public, max-age={settings.STATIC_MAX_AGE}")
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+
+def build_precompressed(directory: Path) -> list[tuple[Path, int, int, int]]:
+    """Write .gz (and .br, if brotli is installed) next to every compressible asset"""
+    results = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix not in PRECOMPRESSED_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        sizes = []
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if encoding == "br" and brotli is None:
+                sizes.append(0)
+                continue
+            compressed = compress(data, encoding)
+            Path(f"{path}{suffix}").write_bytes(compressed)
+            sizes.append(len(compressed))
+        results.append((path, len(data), *sizes))
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command == "static":
+        root = Path(sys.argv[2]) if len(sys.argv) > 2 else Path("static")
+        if brotli is None:
+            print("brotli is not installed: writing .gz only")
+        for path, size, gz_size, br_size in build_precompressed(root):
+            print(f"{path}: {size} -> gzip {gz_size}" + (f", br {br_size}" if br_size else ""))
+    else:
+        print("Usage: python -m app.core.compression static [directory]")
+        sys.exit(1)
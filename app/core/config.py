@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 from pydantic import EmailStr, SecretStr
 
@@ -24,6 +26,23 @@ class Settings(BaseSettings):
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = "supersecretpassword"
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+
+    # Rate limiting ("<route>:<ip|email|user>" -> "N/period[,N/period]")
+    RATE_LIMIT_ENABLED: bool = True
+    TRUSTED_PROXIES: list[str] = ["127.0.0.1", "::1"]  # IP клиента из X-Forwarded-For только от этих адресов (nginx)
+    RATE_LIMIT_FAIL_OPEN_SECONDS: float = 30.0  # пропускать Redis после ошибки (лимиты и кэш дашборда)
+    RATE_LIMITS: dict[str, str] = {
+        "login:ip": "20/minute",
+        "login:email": "5/minute",
+        "register:ip": "5/minute,20/hour",
+        "register:email": "3/hour",
+        "verify:ip": "20/minute",
+        "verify:email": "5/minute",
+        "resend-code:ip": "5/minute",
+        "resend-code:email": "1/minute,5/hour",
+        "analyze:user": "30/minute",
+    }
 
     # PostgreSQL Database
     DB_HOST: str = "localhost"
@@ -32,10 +51,116 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = "1202"
     DB_NAME: str = "jwt"
 
+    # Пул соединений (на один процесс; суммарно воркеры x (POOL_SIZE + MAX_OVERFLOW) <= max_connections)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0             # сек ожидания свободного соединения, затем ошибка
+    DB_POOL_RECYCLE: int = 1800               # сек; пересоздавать старые соединения (-1 - никогда)
+    DB_STATEMENT_CACHE_SIZE: int = 100        # prepared statements asyncpg на соединение; 0 - за pgbouncer (transaction mode)
+
+    # Реплика только для чтения (история, статистика, анализы); пусто - всё читается с основной БД
+    DB_READ_HOST: str = ""
+    DB_READ_PORT: int = 5432
+
+    # Администраторы (email через JSON-список, например ["admin@example.com"])
+    ADMIN_EMAILS: list[str] = []
+
+    # ML модель
+    ML_ENABLED: bool = True            # false - API-only воркер без TensorFlow/NumPy/PIL
+    MODEL_WATCH_INTERVAL: float = 0.0  # сек; >0 - следить за manifest.json и перезагружать модель
+    INFERENCE_MODE: str = "local"      # local - модель в каждом воркере; remote - общий inference server
+    INFERENCE_SOCKET_PATH: str = "/tmp/soil-inference.sock"
+    INFERENCE_SERVER_TIMEOUT: float = 30.0
+
+    # TensorFlow (serving)
+    TF_INTRA_OP_THREADS: int = 0          # 0 - по числу ядер; при N воркерах на хост ~ ядра / N
+    TF_INTER_OP_THREADS: int = 0
+    TF_ENABLE_ONEDNN: bool | None = None  # None - по умолчанию TensorFlow
+    TF_COMPILED_INFERENCE: bool = True    # tf.function вместо model.predict
+    TF_USE_XLA: bool = False              # jit_compile для tf.function
+
+    # Каскад моделей: быстрая модель первой, полная - только при низкой уверенности
+    CASCADE_FAST_VERSION: str = ""        # версия маленькой модели (train_model.py --distill) из реестра; пусто - без каскада
+    CASCADE_THRESHOLD: float = 0.9        # уверенность быстрой модели ниже порога - к полной модели
+
+    # Ограничение памяти воркера (см. app/core/memory.py)
+    MEMORY_LIMIT_MB: float = 0.0           # RSS; 0 - не следить
+    MEMORY_CHECK_INTERVAL: float = 30.0    # сек между проверками
+    MEMORY_LIMIT_ACTION: Literal["clear_session", "recycle"] = "clear_session"  # clear_session - сбросить сессию Keras и перезагрузить модель | recycle - перезапустить процесс (при повторном превышении после сброса - тоже)
+
+    # Admission control для инференса (на один процесс)
+    INFERENCE_MAX_CONCURRENCY: int = 2      # одновременных предсказаний
+    INFERENCE_MAX_QUEUE: int = 16           # запросов в очереди, сверх - 503
+    INFERENCE_MAX_WAIT_SECONDS: float = 10.0  # прогнозируемое ожидание, сверх - 503
+    INFERENCE_MAX_PER_USER: int = 2         # одновременных анализов на пользователя, сверх - 429
+
+    # Кэш дашборда в Redis (последние анализы + статистика пользователя)
+    DASHBOARD_CACHE_ENABLED: bool = True
+    DASHBOARD_CACHE_SIZE: int = 10        # сколько последних анализов держать; history?limit<=N из кэша
+    DASHBOARD_CACHE_TTL: int = 86400      # сек; ограничивает жизнь записи, если обновление не удалось
+
+    # Хранилище загрузок (content-addressed, см. app/services/storage.py)
+    STORAGE_BACKEND: str = "local"            # local | memory
+    STORAGE_LOCAL_ROOT: str = "."             # ключи вида uploads/ab/cd/<sha256>.jpg относительно корня
+    STORAGE_GC_INTERVAL: float = 3600.0       # сек между сборками мусора; 0 - выключено
+    STORAGE_GC_GRACE_SECONDS: float = 3600.0  # не трогать файлы моложе (запрос мог ещё не сохранить анализ)
+
+    # Уменьшение снимков в браузере перед загрузкой (canvas -> JPEG)
+    UPLOAD_MAX_DIMENSION: int = 1280      # px по длинной стороне; 0 - отправлять файл как есть
+    UPLOAD_JPEG_QUALITY: float = 0.85     # качество JPEG при перекодировании (0..1)
+    UPLOAD_ACCEPT_ORIGINAL: bool = True   # принимать оригинал вместе с уменьшенной копией (по выбору пользователя)
+
+    # Проверка загрузок по заголовку файла, до записи на диск и декодирования
+    UPLOAD_ALLOWED_FORMATS: list[str] = ["jpeg", "png"]  # по сигнатуре (jpeg | png | webp), не по расширению
+    UPLOAD_MAX_PIXELS: int = 40_000_000   # ширина × высота из заголовка (защита от decompression bomb)
+    UPLOAD_MIN_DIMENSION: int = 32        # px по короткой стороне
+
+    # Отдача изображений анализов (GET /api/v1/soil/image/{id})
+    IMAGE_DELIVERY: str = "app"               # app - файл отдаёт Python | x-accel - X-Accel-Redirect (nginx) | x-sendfile - X-Sendfile (Apache, lighttpd)
+    IMAGE_ACCEL_PREFIX: str = "/_protected/"  # internal location nginx с alias на STORAGE_LOCAL_ROOT
+    UPLOADS_PUBLIC: bool = True               # false - без публичного /uploads: image_url ведёт на эндпоинт с проверкой владельца
+
+    # Поиск повторных загрузок того же снимка (перцептивный хэш)
+    DUPLICATE_DETECTION: str = "reuse"  # off | flag - пометить duplicate_of | reuse - вернуть прежний результат без инференса
+    DUPLICATE_MAX_DISTANCE: int = 6     # порог расстояния Хэмминга между 64-битными dHash
+    DUPLICATE_LOOKUP_LIMIT: int = 1000  # сколько последних анализов пользователя сравнивать
+
+    # Поиск похожих образцов по эмбеддингам CNN (индекс в памяти каждого воркера)
+    SIMILARITY_INDEX_ENABLED: bool = True
+    SIMILARITY_REFRESH_SECONDS: float = 30.0  # как часто догружать новые строки из БД
+    SIMILARITY_IVF_MIN_SIZE: int = 50000      # с этого размера глобальный поиск идёт по IVF-ячейкам
+    SIMILARITY_IVF_LISTS: int = 256
+    SIMILARITY_IVF_NPROBE: int = 8
+
+    # Аналитика по всем пользователям (таблица soil_analytics_rollups)
+    ANALYTICS_ROLLUP_INTERVAL: float = 300.0      # сек между пересчётами; 0 - выключено
+    ANALYTICS_ROLLUP_LOOKBACK_DAYS: float = 14.0  # пересчитывать корзины за последние N дней
+
+    # Сжатие ответов и кэширование страниц
+    COMPRESSION_ENABLED: bool = True      # brotli (если установлен) или gzip для JSON/HTML/CSS/JS
+    COMPRESSION_MIN_SIZE: int = 500       # байт; меньшие ответы не сжимаются
+    STATIC_MAX_AGE: int = 3600            # Cache-Control max-age для /static (сек)
+    TEMPLATE_CACHE_ENABLED: bool = True   # false - рендерить шаблоны на каждый запрос (разработка)
+
+    # Профилирование запросов (cProfile)
+    PROFILING_ENABLED: bool = False       # профилировать запросы по PROFILING_PATHS
+    PROFILING_SAMPLE_RATE: float = 1.0    # доля профилируемых запросов при PROFILING_ENABLED
+    PROFILING_PATHS: list[str] = ["/api/v1/soil/analyze"]  # префиксы путей; пусто - все пути
+    PROFILING_HEADER: str = "X-Profile"   # заголовок для профилирования отдельного запроса
+    PROFILING_TOKEN: str = ""             # значение заголовка; пусто - профилирование по заголовку выключено
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 200
+
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def DATABASE_READ_URL(self) -> str | None:
+        if not self.DB_READ_HOST:
+            return None
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_READ_HOST}:{self.DB_READ_PORT}/{self.DB_NAME}"
+
     class Config:
         env_file = ".env"        # можно хранить настройки в .env
         case_sensitive = False
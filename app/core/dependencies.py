@@ -1,12 +1,15 @@
 from typing import AsyncGenerator
 
-from fastapi import Depends, HTTPException, Header
+from fastapi import Depends, HTTPException, Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import AsyncSessionLocal
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, ReadSessionLocal, read_engine
 from app.repository.postgres import DatabaseRepo
+from app.services.dashboard_cache import get_dashboard_cache
 from app.services.email_service import EmailClient
 from app.services.jwt_client import JWTClient
+from app.services.rate_limiter import RateLimiter
 from app.services.redis_client import RedisClient
 from app.db.models import User
 
@@ -17,9 +20,21 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
-async def get_repo(db: AsyncSession = Depends(get_db)) -> DatabaseRepo:
+async def get_read_db() -> AsyncGenerator[AsyncSession | None, None]:
+    """Dependency: сессия реплики для чтения (None без DB_READ_HOST - читаем через get_db)."""
+    if read_engine is None:
+        yield None
+        return
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+async def get_repo(
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession | None = Depends(get_read_db)
+) -> DatabaseRepo:
     """Dependency для получения репозитория."""
-    return DatabaseRepo(db)
+    return DatabaseRepo(db, dashboard_cache=get_dashboard_cache(), read_db=read_db)
 
 
 async def get_jwt_client() -> JWTClient:
@@ -33,6 +48,32 @@ async def get_redis_client() -> RedisClient:
     return RedisClient()
 
 
+def client_ip(request: Request) -> str | None:
+    """
+    IP of the client for per-IP rate limits
+
+    Behind a reverse proxy request.client is the proxy itself. If it is one of
+    TRUSTED_PROXIES, the address is taken from X-Forwarded-For: the right-most
+    entry that is not a trusted proxy (entries further left are set by the
+    client and can be forged). None if the server did not get a peer address.
+    """
+    if request.client is None:
+        return None
+    host = request.client.host
+    if host not in settings.TRUSTED_PROXIES:
+        return host
+
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for address in reversed(forwarded):
+        if address not in settings.TRUSTED_PROXIES:
+            return address
+    return forwarded[0] if forwarded else host
+
+
+async def get_rate_limiter(redis: RedisClient = Depends(get_redis_client)) -> RateLimiter:
+    return RateLimiter(redis)
+
+
 async def get_current_user(
     authorization: str = Header(...),
     repo: DatabaseRepo = Depends(get_repo),
@@ -61,4 +102,12 @@ async def get_current_user(
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
 
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """Get current user and require admin rights (ADMIN_EMAILS)"""
+    if current_user.email not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return current_user
@@ -0,0 +1,102 @@
+"""
+Startup import-time report
+
+    python -m app.core.import_report                  # import app.main
+    python -m app.core.import_report app.main --top 30
+    ML_ENABLED=false python -m app.core.import_report
+
+Imports the module in a fresh interpreter with `-X importtime` and prints
+the wall time, peak RSS, the slowest imports (cumulative) and the
+self time aggregated per top-level package, so regressions such as
+TensorFlow sneaking back into the API import path are easy to spot.
+"""
+import argparse
+import re
+import resource
+import subprocess
+import sys
+import time
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+HEAVY_MODULES = ("tensorflow", "keras", "numpy", "PIL")
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, int, int, str]]:
+    """Lines of `-X importtime` output as (self_us, cumulative_us, depth, module)"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            # Один уровень вложенности = два пробела после разделителя
+            rows.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, module))
+    return rows
+
+
+def build_report(module: str) -> dict:
+    code = f"import {module}; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True
+    )
+    wall_time = time.perf_counter() - started
+
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = parse_importtime(result.stderr)
+
+    by_package: dict[str, int] = {}
+    for self_us, _cumulative_us, _depth, name in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    slowest = sorted(
+        ((cumulative_us, depth, name) for _self_us, cumulative_us, depth, name in rows),
+        reverse=True
+    )
+
+    # ru_maxrss: КБ на Linux, байты на macOS
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    max_rss_mb = max_rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+    return {
+        "module": module,
+        "wall_time": wall_time,
+        "import_time": sum(self_us for self_us, *_ in rows) / 1e6,
+        "max_rss_mb": max_rss_mb,
+        "heavy_loaded": [m for m in result.stdout.strip().split(",") if m],
+        "slowest": slowest,
+        "by_package": sorted(by_package.items(), key=lambda item: -item[1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time report for API startup")
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    report = build_report(args.module)
+
+    print("=" * 60)
+    print(f"IMPORT REPORT: {report['module']}")
+    print("=" * 60)
+    print(f"Wall time (interpreter + imports): {report['wall_time']:.2f} s")
+    print(f"Import time (sum of self):         {report['import_time']:.2f} s")
+    print(f"Peak RSS:                          {report['max_rss_mb']:.0f} MB")
+    print(f"Heavy ML modules loaded:           {', '.join(report['heavy_loaded']) or 'none'}")
+
+    print(f"\nSlowest imports (cumulative):")
+    for cumulative_us, depth, name in report["slowest"][:args.top]:
+        print(f"  {cumulative_us / 1000:10.1f} ms  {'  ' * depth}{name}")
+
+    print(f"\nSelf time by package:")
+    for package, self_us in report["by_package"][:args.top]:
+        print(f"  {self_us / 1000:10.1f} ms  {package}")
+
+
+if __name__ == "__main__":
+    main()
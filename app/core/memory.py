@@ -0,0 +1,95 @@
+"""
+Process memory: RSS readings and the memory limit watcher
+
+With MEMORY_LIMIT_MB > 0 every process that holds the model (API workers
+with INFERENCE_MODE=local, or the inference server) checks its RSS every
+MEMORY_CHECK_INTERVAL seconds. Over the limit it either clears the Keras
+session and reloads the model in place (MEMORY_LIMIT_ACTION=clear_session),
+or shuts itself down gracefully so the process manager starts a fresh one
+(MEMORY_LIMIT_ACTION=recycle; needs uvicorn --workers N, gunicorn, systemd
+or a container restart policy). If RSS is still over the limit at the next
+check after clearing the session, the leak is not Keras state and the
+process is recycled instead.
+
+API workers without a model (INFERENCE_MODE=remote, ML_ENABLED=false) are
+watched only with MEMORY_LIMIT_ACTION=recycle.
+
+Leak hunting is done offline with soak_test.py.
+"""
+import asyncio
+import os
+import resource
+import signal
+import sys
+from typing import TYPE_CHECKING, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from app.services.ml_service import SoilMLService
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, MB"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 / 1024
+    except OSError:
+        # Не Linux: только пиковое значение (ru_maxrss в КБ, на macOS - в байтах)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class MemoryGuard:
+    """Over-limit policy shared by API workers (asyncio task) and the inference server (thread)"""
+
+    def __init__(self, limit_mb: float, action: str, service: Optional["SoilMLService"]):
+        self.limit_mb = limit_mb
+        self.action = action
+        self.service = service
+        # Сессия уже сбрасывалась, а RSS с тех пор не опускался ниже лимита
+        self._cleared = False
+
+    def check(self) -> bool:
+        """One check (blocking: clearing the session reloads the model); False once recycling"""
+        rss = rss_mb()
+        if rss < self.limit_mb:
+            self._cleared = False
+            return True
+
+        if self.action == "clear_session" and self.service is not None and not self._cleared:
+            try:
+                self.service.clear_session()
+            except Exception as e:
+                print(f"Clearing Keras session failed: {e}")
+            else:
+                self._cleared = True
+                print(f"RSS {rss:.0f} MB over {self.limit_mb:.0f} MB: Keras session cleared, now {rss_mb():.0f} MB")
+                return True
+
+        # SIGTERM самому себе: uvicorn/gunicorn дожидаются текущих запросов и поднимают новый процесс
+        reason = " (still over after clearing the Keras session)" if self._cleared else ""
+        print(f"RSS {rss:.0f} MB over {self.limit_mb:.0f} MB{reason}: recycling process {os.getpid()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+        return False
+
+
+async def watch_memory(limit_mb: float, interval: float, action: str):
+    """Check RSS of this API worker periodically and clear the Keras session or recycle it over the limit"""
+    service = None
+    if settings.ML_ENABLED and settings.INFERENCE_MODE == "local":
+        from app.services.ml_service import get_ml_service
+        service = get_ml_service()
+    elif action == "clear_session":
+        print("Memory watcher off: no model in this worker (the inference server watches its own), use recycle to limit it")
+        return
+
+    guard = MemoryGuard(limit_mb, action, service)
+    while True:
+        await asyncio.sleep(interval)
+        if not await run_in_threadpool(guard.check):
+            return
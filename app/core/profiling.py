@@ -0,0 +1,241 @@
+"""
+On-demand request profiling (cProfile)
+
+A request is profiled when:
+- it carries the PROFILING_HEADER with a value equal to PROFILING_TOKEN, or
+- PROFILING_ENABLED is set, its path matches PROFILING_PATHS and it wins
+  the PROFILING_SAMPLE_RATE draw.
+
+Every profile is stored in PROFILING_DIR as a raw `.prof` dump (for
+snakeviz / pstats) plus a `.json` summary with the top functions and the
+self-time split between PIL, NumPy, TensorFlow, the database driver and
+application code.
+
+cProfile hooks the whole thread, so coroutines of other requests running on
+the event loop while a profiled request awaits are included as well. Work
+offloaded to the threadpool is captured when it is wrapped with
+`profile_in_thread`. Only one request is profiled at a time.
+"""
+import cProfile
+import json
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+PROFILE_ID_RE = re.compile(r"^[0-9A-Za-z_\-]+$")
+TOP_FUNCTIONS = 40
+
+# Профили, снятые в потоках threadpool для текущего профилируемого запроса
+_thread_profiles: ContextVar[list | None] = ContextVar("_thread_profiles", default=None)
+
+# Порядок важен: первая совпавшая группа выигрывает
+_BREAKDOWN_GROUPS = [
+    ("tensorflow", ("tensorflow", "keras", "tf_keras", "pywrap_tf")),
+    ("numpy", ("numpy",)),
+    ("PIL", ("PIL", "Imaging")),
+    ("database", ("sqlalchemy", "asyncpg")),
+    ("redis", ("redis",)),
+    ("app", ("/app/",)),
+]
+
+
+def _profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+def _classify(filename: str, funcname: str) -> str:
+    """Отнести функцию к группе по пути файла или имени built-in метода"""
+    haystack = f"{filename} {funcname}".replace("\\", "/")
+    for group, markers in _BREAKDOWN_GROUPS:
+        if any(marker in haystack for marker in markers):
+            return group
+    return "other"
+
+
+def summarize_profile(stats: pstats.Stats) -> dict:
+    """Build the JSON summary: per-library breakdown and top functions"""
+    breakdown: dict[str, float] = {}
+    rows = []
+    for (filename, lineno, funcname), (cc, nc, tt, ct, _callers) in stats.stats.items():
+        group = _classify(filename, funcname)
+        breakdown[group] = breakdown.get(group, 0.0) + tt
+        rows.append({
+            "function": f"{filename}:{lineno}({funcname})",
+            "group": group,
+            "calls": nc,
+            "tottime": round(tt, 6),
+            "cumtime": round(ct, 6),
+        })
+
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+
+    return {
+        "total_time": round(stats.total_tt, 6),
+        "breakdown": {k: round(v, 6) for k, v in sorted(breakdown.items(), key=lambda i: -i[1])},
+        "top_functions": rows[:TOP_FUNCTIONS],
+    }
+
+
+def profile_in_thread(func, *args, **kwargs):
+    """
+    Call func under its own profiler if the current request is being profiled.
+
+    Meant for `run_in_threadpool(profile_in_thread, func, ...)`: the request
+    context (and the collected profiles list) is copied into the worker thread.
+    """
+    profiles = _thread_profiles.get()
+    if profiles is None:
+        return func(*args, **kwargs)
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: профилировщик глобальный и уже видит все потоки
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+
+def new_profile_id(method: str, path: str) -> str:
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", path).strip("_") or "root"
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}_{method.lower()}_{slug}_{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profile_id: str, stats: pstats.Stats, meta: dict):
+    """Dump profile and summary to disk"""
+    directory = _profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stats.dump_stats(str(directory / f"{profile_id}.prof"))
+
+    summary = {"id": profile_id, **meta, **summarize_profile(stats)}
+    with open(directory / f"{profile_id}.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    _prune(directory)
+
+
+def _store_profile(profile_id: str, profiler: cProfile.Profile, thread_profiles: list, meta: dict):
+    """Merge the request's profilers and save them (blocking; runs in the threadpool)"""
+    stats = pstats.Stats(profiler)
+    for thread_profiler in thread_profiles:
+        stats.add(thread_profiler)
+    save_profile(profile_id, stats, meta)
+
+
+def _prune(directory: Path):
+    """Оставить не более PROFILING_MAX_FILES последних профилей"""
+    summaries = sorted(directory.glob("*.json"))
+    for old in summaries[:max(len(summaries) - settings.PROFILING_MAX_FILES, 0)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def list_profiles(limit: int = 50) -> list[dict]:
+    """Latest profiles without the per-function table"""
+    directory = _profile_dir()
+    if not directory.exists():
+        return []
+
+    result = []
+    for path in sorted(directory.glob("*.json"), reverse=True)[:limit]:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        summary.pop("top_functions", None)
+        result.append(summary)
+    return result
+
+
+def get_profile_path(profile_id: str, suffix: str) -> Path | None:
+    """Resolve stored profile file, rejecting anything that is not a plain id"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = _profile_dir() / f"{profile_id}{suffix}"
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests with cProfile"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._lock = threading.Lock()
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if settings.PROFILING_TOKEN:
+            header = settings.PROFILING_HEADER.lower().encode("latin-1")
+            for name, value in scope["headers"]:
+                if name == header and value.decode("latin-1") == settings.PROFILING_TOKEN:
+                    return True
+
+        if not settings.PROFILING_ENABLED:
+            return False
+
+        path = scope["path"]
+        if settings.PROFILING_PATHS and not any(path.startswith(p) for p in settings.PROFILING_PATHS):
+            return False
+
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Только один профилировщик на поток
+        if not self._lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        profiler = cProfile.Profile()
+        thread_profiles: list = []
+        token = _thread_profiles.set(thread_profiles)
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+        finally:
+            _thread_profiles.reset(token)
+            self._lock.release()
+
+        meta = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "wall_time": round(time.perf_counter() - started, 6),
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        # Ответ уже отправлен; pstats и запись на диск - в потоке, не в цикле событий
+        try:
+            await run_in_threadpool(_store_profile, profile_id, profiler, thread_profiles, meta)
+        except Exception as e:
+            print(f"Saving profile {profile_id} failed: {e}")
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Text
+from sqlalchemy import BigInteger, ForeignKey, LargeBinary, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 
@@ -27,10 +27,22 @@ class SoilAnalysis(Base):
     # Image info
     image_filename: Mapped[str]
     image_path: Mapped[str]
+    # Full-size photo, stored only when the user opted in (image_path is the downscaled upload)
+    original_image_path: Mapped[str | None]
+    # Perceptual hash (dHash) for near-duplicate lookup within a user's uploads
+    image_hash: Mapped[int | None] = mapped_column(BigInteger)
+    # Earlier analysis of (nearly) the same photo, if one was found at upload
+    duplicate_of: Mapped[int | None] = mapped_column(ForeignKey("soil_analyses.id", ondelete="SET NULL"))
 
     # Analysis results
     soil_type: Mapped[str] = mapped_column(index=True)
     confidence: Mapped[float]
+    model_version: Mapped[str | None] = mapped_column(index=True)
+    # "fast" / "full" when the model cascade answered (model_version is the model that did)
+    cascade_stage: Mapped[str | None]
+
+    # L2-normalized CNN embedding (float16 bytes), loaded only when asked for
+    embedding: Mapped[bytes | None] = mapped_column(LargeBinary, deferred=True)
 
     # Soil information (JSON stored as TEXT)
     description: Mapped[str] = mapped_column(Text)
@@ -42,4 +54,16 @@ class SoilAnalysis(Base):
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, index=True)
 
     # Relationship to user
-    user: Mapped["User"] = relationship(back_populates="soil_analyses")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="soil_analyses")
+
+class SoilAnalyticsRollup(Base):
+    """Analyses of all users per time bucket and soil type (maintained by app/services/analytics.py)"""
+    __tablename__ = "soil_analytics_rollups"
+
+    period: Mapped[str] = mapped_column(primary_key=True)  # day | week
+    bucket: Mapped[datetime] = mapped_column(primary_key=True)  # date_trunc(period, created_at)
+    soil_type: Mapped[str] = mapped_column(primary_key=True)
+
+    count: Mapped[int]
+    # Сумма, а не среднее: складывается по корзинам, среднее = confidence_sum / count
+    confidence_sum: Mapped[float]
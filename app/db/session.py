@@ -1,17 +1,66 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.core.config import settings
 
 # PostgreSQL БД
 DATABASE_URL = settings.DATABASE_URL
 
-# Асинхронный движок
-engine = create_async_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Проверка соединения перед использованием
-    echo=False,  # Логирование SQL запросов (можно включить для отладки)
-    future=True
-)
+
+def make_engine(url: str) -> AsyncEngine:
+    """Асинхронный движок с настройками пула из Settings"""
+    return create_async_engine(
+        url,
+        pool_pre_ping=True,  # Проверка соединения перед использованием
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={
+            # Кэш prepared statements: у диалекта SQLAlchemy и у самого asyncpg
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+        echo=False,  # Логирование SQL запросов (можно включить для отладки)
+        future=True
+    )
+
+
+class PoolMetrics:
+    """Checkout counters of an engine's pool (per process)"""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.checkouts = 0
+        self.peak_checked_out = 0
+        event.listen(engine.sync_engine, "checkout", self._on_checkout)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.engine.pool.checkedout())
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_connections": settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+            "checkouts": self.checkouts,
+            "peak_checked_out": self.peak_checked_out,
+        }
+
+
+# Асинхронный движок (запись и чтение по умолчанию)
+engine = make_engine(DATABASE_URL)
+
+# Реплика для чтения, если задан DB_READ_HOST
+read_engine = make_engine(settings.DATABASE_READ_URL) if settings.DATABASE_READ_URL else None
+
+pool_metrics = {"primary": PoolMetrics(engine)}
+if read_engine is not None:
+    pool_metrics["replica"] = PoolMetrics(read_engine)
 
 # Фабрика асинхронных сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -22,7 +71,21 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+# Сессии только для чтения (без реплики - та же основная БД)
+ReadSessionLocal = async_sessionmaker(
+    read_engine or engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
+
+def get_pool_stats() -> dict:
+    """Pool usage of every engine of this process"""
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
 
 # Базовый класс для моделей (SQLAlchemy 2.0 стиль)
 class Base(DeclarativeBase):
-    pass
\ No newline at end of file
+    pass
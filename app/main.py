@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from pathlib import Path
 
@@ -5,7 +6,15 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from app.api.router import router as api_router
-from app.db.session import Base, engine
+from app.api.v1.endpoints.frontend import prerender_pages
+from app.core.compression import CompressionMiddleware, PrecompressedStaticFiles
+from app.core.config import settings
+from app.core.memory import watch_memory
+from app.core.profiling import ProfilingMiddleware
+from app.db.session import Base, engine, read_engine
+from app.services.analytics import run_analytics_rollups
+from app.services.ml_service import watch_model_manifest
+from app.services.storage import run_storage_gc
 
 # Определяем базовую директорию проекта
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -18,10 +27,47 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    # HTML страниц без данных запроса - один раз, сразу в gzip/br
+    if settings.TEMPLATE_CACHE_ENABLED:
+        prerender_pages()
+
+    # Hot reload модели при смене активной версии в manifest.json
+    watcher = None
+    # (в remote-режиме за манифестом следит inference server)
+    if settings.ML_ENABLED and settings.MODEL_WATCH_INTERVAL > 0 and settings.INFERENCE_MODE == "local":
+        watcher = asyncio.create_task(watch_model_manifest(settings.MODEL_WATCH_INTERVAL))
+
+    # Удаление загрузок, на которые не ссылается ни один анализ
+    storage_gc = None
+    if settings.STORAGE_GC_INTERVAL > 0:
+        storage_gc = asyncio.create_task(run_storage_gc(settings.STORAGE_GC_INTERVAL))
+
+    # Сброс сессии Keras / перезапуск воркера при превышении MEMORY_LIMIT_MB
+    memory_watcher = None
+    if settings.MEMORY_LIMIT_MB > 0:
+        memory_watcher = asyncio.create_task(watch_memory(
+            settings.MEMORY_LIMIT_MB, settings.MEMORY_CHECK_INTERVAL, settings.MEMORY_LIMIT_ACTION
+        ))
+
+    # Агрегаты аналитики по дням/неделям
+    analytics_rollup = None
+    if settings.ANALYTICS_ROLLUP_INTERVAL > 0:
+        analytics_rollup = asyncio.create_task(run_analytics_rollups(settings.ANALYTICS_ROLLUP_INTERVAL))
+
     yield
 
     # Shutdown: Закрываем соединения
+    if watcher:
+        watcher.cancel()
+    if storage_gc:
+        storage_gc.cancel()
+    if analytics_rollup:
+        analytics_rollup.cancel()
+    if memory_watcher:
+        memory_watcher.cancel()
     await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
 
 
 app = FastAPI(
@@ -30,9 +76,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Профилирование запросов по заголовку / сэмплированию (см. PROFILING_* в настройках)
+app.add_middleware(ProfilingMiddleware)
+
+# Сжатие JSON/HTML/CSS/JS (brotli или gzip по Accept-Encoding); внешний слой
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
 # Подключаем статические файлы
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
-app.mount("/uploads", StaticFiles(directory=str(BASE_DIR / "uploads")), name="uploads")
+app.mount("/static", PrecompressedStaticFiles(directory=str(BASE_DIR / "static")), name="static")
+if settings.UPLOADS_PUBLIC:
+    app.mount("/uploads", StaticFiles(directory=str(BASE_DIR / "uploads")), name="uploads")
 
 # Подключаем главный роутер
 app.include_router(api_router)
@@ -1,14 +1,38 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Sequence
+
+from sqlalchemy.engine import RowMapping
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import delete, insert, literal, select, desc, func, text, union
+from sqlalchemy.orm import undefer
 
 from app.core.security import verify_password
-from app.db.models import User, SoilAnalysis
+from app.db.models import User, SoilAnalysis, SoilAnalyticsRollup
 from app.repository.base import BaseRepo
+from app.services.preprocessing import hamming_distance
+
+if TYPE_CHECKING:
+    from app.services.dashboard_cache import DashboardCache
 
 
 class DatabaseRepo(BaseRepo):
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        dashboard_cache: "DashboardCache | None" = None,
+        read_db: AsyncSession | None = None
+    ):
         self.db = db
+        # Write-through кэш дашборда: обновляется после каждого изменения анализов
+        self.dashboard_cache = dashboard_cache
+        # Сессия реплики для чтения истории и статистики (может отставать на доли секунды)
+        self.read_db = read_db if read_db is not None else db
+
+    def primary(self) -> "DatabaseRepo":
+        """Same repo with every read on the primary (read-your-writes)"""
+        if self.read_db is self.db:
+            return self
+        return DatabaseRepo(self.db, dashboard_cache=self.dashboard_cache)
 
     async def save_user(self, user: User) -> int:
         try:
@@ -60,14 +84,17 @@ class DatabaseRepo(BaseRepo):
             self.db.add(analysis)
             await self.db.commit()
             await self.db.refresh(analysis)
-            return analysis.id
         except Exception:
             await self.db.rollback()
             raise
 
+        if self.dashboard_cache is not None:
+            await self.dashboard_cache.refresh(self.primary(), analysis.user_id)
+        return analysis.id
+
     async def get_soil_analysis_by_id(self, analysis_id: int, user_id: int) -> SoilAnalysis | None:
         """Get soil analysis by ID for specific user"""
-        result = await self.db.execute(
+        result = await self.read_db.execute(
             select(SoilAnalysis).where(
                 SoilAnalysis.id == analysis_id,
                 SoilAnalysis.user_id == user_id
@@ -77,7 +104,7 @@ class DatabaseRepo(BaseRepo):
 
     async def get_user_soil_analyses(self, user_id: int, limit: int = 50, offset: int = 0) -> list[SoilAnalysis]:
         """Get all soil analyses for a user"""
-        result = await self.db.execute(
+        result = await self.read_db.execute(
             select(SoilAnalysis)
             .where(SoilAnalysis.user_id == user_id)
             .order_by(desc(SoilAnalysis.created_at))
@@ -86,23 +113,249 @@ class DatabaseRepo(BaseRepo):
         )
         return list(result.scalars().all())
 
-    async def delete_soil_analysis(self, analysis_id: int, user_id: int) -> bool:
-        """Delete soil analysis"""
-        analysis = await self.get_soil_analysis_by_id(analysis_id, user_id)
-        if not analysis:
-            return False
+    async def get_user_soil_analysis_rows(self, user_id: int, limit: int = 50, offset: int = 0) -> Sequence[RowMapping]:
+        """Page of a user's analyses as plain rows with the response columns (no ORM objects)"""
+        result = await self.read_db.execute(
+            select(
+                SoilAnalysis.id,
+                SoilAnalysis.image_filename,
+                SoilAnalysis.image_path,
+                SoilAnalysis.original_image_path,
+                SoilAnalysis.soil_type,
+                SoilAnalysis.confidence,
+                SoilAnalysis.description,
+                SoilAnalysis.characteristics,
+                SoilAnalysis.recommended_crops,
+                SoilAnalysis.recommendations,
+                SoilAnalysis.model_version,
+                SoilAnalysis.cascade_stage,
+                SoilAnalysis.duplicate_of,
+                SoilAnalysis.created_at
+            )
+            .where(SoilAnalysis.user_id == user_id)
+            .order_by(desc(SoilAnalysis.created_at))
+            .limit(limit)
+            .offset(offset)
+        )
+        return result.mappings().all()
+
+    async def stream_user_soil_analyses(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Sequence[RowMapping]]:
+        """Stream all analyses of a user in batches through a server-side cursor"""
+        result = await self.read_db.stream(
+            select(
+                SoilAnalysis.id,
+                SoilAnalysis.created_at,
+                SoilAnalysis.soil_type,
+                SoilAnalysis.confidence,
+                SoilAnalysis.model_version,
+                SoilAnalysis.image_filename,
+                SoilAnalysis.description,
+                SoilAnalysis.characteristics,
+                SoilAnalysis.recommended_crops,
+                SoilAnalysis.recommendations
+            )
+            .where(SoilAnalysis.user_id == user_id)
+            .order_by(desc(SoilAnalysis.created_at))
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.mappings().partitions():
+            yield partition
+
+    async def stream_soil_embeddings(self, after_id: int = 0, batch_size: int = 2000) -> AsyncIterator[Sequence[RowMapping]]:
+        """Stream (id, user_id, embedding) of analyses with an embedding and id > after_id"""
+        result = await self.db.stream(
+            select(SoilAnalysis.id, SoilAnalysis.user_id, SoilAnalysis.embedding)
+            .where(SoilAnalysis.embedding.is_not(None), SoilAnalysis.id > after_id)
+            .order_by(SoilAnalysis.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.mappings().partitions():
+            yield partition
+
+    async def get_soil_analyses_by_ids(self, analysis_ids: list[int]) -> dict[int, RowMapping]:
+        """Summary columns of the given analyses keyed by id (missing ids are absent)"""
+        if not analysis_ids:
+            return {}
+        result = await self.read_db.execute(
+            select(
+                SoilAnalysis.id,
+                SoilAnalysis.user_id,
+                SoilAnalysis.soil_type,
+                SoilAnalysis.confidence,
+                SoilAnalysis.created_at
+            )
+            .where(SoilAnalysis.id.in_(analysis_ids))
+        )
+        return {row["id"]: row for row in result.mappings().all()}
+
+    async def find_similar_image(self, user_id: int, image_hash: int, max_distance: int, limit: int = 1000) -> SoilAnalysis | None:
+        """Closest earlier analysis of the user by perceptual hash, within max_distance bits"""
+        result = await self.db.execute(
+            select(SoilAnalysis.id, SoilAnalysis.image_hash)
+            .where(SoilAnalysis.user_id == user_id, SoilAnalysis.image_hash.is_not(None))
+            .order_by(desc(SoilAnalysis.created_at))
+            .limit(limit)
+        )
+
+        best_id, best_distance = None, max_distance + 1
+        for analysis_id, candidate in result.all():
+            distance = hamming_distance(image_hash, candidate)
+            if distance < best_distance:
+                best_id, best_distance = analysis_id, distance
+                if distance == 0:
+                    break
+
+        if best_id is None:
+            return None
+        result = await self.db.execute(
+            select(SoilAnalysis).options(undefer(SoilAnalysis.embedding)).where(SoilAnalysis.id == best_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_referenced_image_paths(self, image_paths: list[str]) -> set[str]:
+        """Subset of the given image paths that some analysis still points at"""
+        if not image_paths:
+            return set()
+        result = await self.db.execute(
+            union(
+                select(SoilAnalysis.image_path).where(SoilAnalysis.image_path.in_(image_paths)),
+                select(SoilAnalysis.original_image_path).where(SoilAnalysis.original_image_path.in_(image_paths))
+            )
+        )
+        return set(result.scalars().all())
+
+    async def delete_soil_analysis(self, analysis_id: int, user_id: int) -> RowMapping | None:
+        """Delete soil analysis in one statement; returns its image keys (None if not found)"""
+        deleted = await self.delete_soil_analyses(user_id, analysis_ids=[analysis_id])
+        return deleted[0] if deleted else None
+
+    async def delete_soil_analyses(
+        self,
+        user_id: int,
+        analysis_ids: list[int] | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None
+    ) -> Sequence[RowMapping]:
+        """
+        Delete a user's analyses by ids and/or created_at range with DELETE ... RETURNING
+
+        Returns (id, image_path, original_image_path) of the deleted rows; the
+        files are left to the caller (other analyses may share them).
+        """
+        statement = delete(SoilAnalysis).where(SoilAnalysis.user_id == user_id)
+        if analysis_ids is not None:
+            statement = statement.where(SoilAnalysis.id.in_(analysis_ids))
+        if created_from is not None:
+            statement = statement.where(SoilAnalysis.created_at >= created_from)
+        if created_to is not None:
+            statement = statement.where(SoilAnalysis.created_at < created_to)
 
         try:
-            await self.db.delete(analysis)
+            result = await self.db.execute(
+                statement
+                .returning(SoilAnalysis.id, SoilAnalysis.image_path, SoilAnalysis.original_image_path)
+                .execution_options(synchronize_session=False)
+            )
+            deleted = result.mappings().all()
             await self.db.commit()
-            return True
         except Exception:
             await self.db.rollback()
             raise
 
+        if deleted and self.dashboard_cache is not None:
+            await self.dashboard_cache.refresh(self.primary(), user_id)
+        return deleted
+
     async def count_user_analyses(self, user_id: int) -> int:
         """Count total analyses for a user"""
-        result = await self.db.execute(
-            select(SoilAnalysis).where(SoilAnalysis.user_id == user_id)
+        result = await self.read_db.execute(
+            select(func.count()).select_from(SoilAnalysis).where(SoilAnalysis.user_id == user_id)
+        )
+        return result.scalar_one()
+
+    async def count_user_analyses_by_soil_type(self, user_id: int) -> dict[str, int]:
+        """Number of analyses of a user per soil type"""
+        result = await self.read_db.execute(
+            select(SoilAnalysis.soil_type, func.count())
+            .where(SoilAnalysis.user_id == user_id)
+            .group_by(SoilAnalysis.soil_type)
         )
-        return len(list(result.scalars().all()))
\ No newline at end of file
+        return dict(result.all())
+
+    # Analytics rollups (all users)
+    async def refresh_analytics_rollups(self, period: str, since: datetime | None = None) -> bool:
+        """
+        Recompute rollup buckets of a period ("day" / "week") from `since` on
+
+        since must be a bucket start; None rebuilds everything. The window is
+        replaced in one transaction (readers see the old rows until commit),
+        so deletes inside it are reflected too. Returns False if another
+        worker holds the rollup lock.
+        """
+        try:
+            locked = await self.db.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": f"analytics_rollup:{period}"}
+            )
+            if not locked.scalar_one():
+                await self.db.rollback()
+                return False
+
+            bucket = func.date_trunc(period, SoilAnalysis.created_at)
+            aggregate = (
+                select(
+                    literal(period),
+                    bucket,
+                    SoilAnalysis.soil_type,
+                    func.count(),
+                    func.sum(SoilAnalysis.confidence)
+                )
+                .group_by(bucket, SoilAnalysis.soil_type)
+            )
+            stale = delete(SoilAnalyticsRollup).where(SoilAnalyticsRollup.period == period)
+            if since is not None:
+                aggregate = aggregate.where(SoilAnalysis.created_at >= since)
+                stale = stale.where(SoilAnalyticsRollup.bucket >= since)
+
+            await self.db.execute(stale)
+            await self.db.execute(
+                insert(SoilAnalyticsRollup).from_select(
+                    ["period", "bucket", "soil_type", "count", "confidence_sum"], aggregate
+                )
+            )
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        return True
+
+    async def has_analytics_rollups(self) -> bool:
+        result = await self.db.execute(select(SoilAnalyticsRollup.period).limit(1))
+        return result.first() is not None
+
+    async def get_analytics_rollups(
+        self,
+        period: str,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        soil_type: str | None = None
+    ) -> Sequence[RowMapping]:
+        """Rollup rows (bucket, soil_type, count, confidence_sum) of a period, oldest bucket first"""
+        statement = (
+            select(
+                SoilAnalyticsRollup.bucket,
+                SoilAnalyticsRollup.soil_type,
+                SoilAnalyticsRollup.count,
+                SoilAnalyticsRollup.confidence_sum
+            )
+            .where(SoilAnalyticsRollup.period == period)
+            .order_by(SoilAnalyticsRollup.bucket, SoilAnalyticsRollup.soil_type)
+        )
+        if date_from is not None:
+            statement = statement.where(SoilAnalyticsRollup.bucket >= date_from)
+        if date_to is not None:
+            statement = statement.where(SoilAnalyticsRollup.bucket < date_to)
+        if soil_type is not None:
+            statement = statement.where(SoilAnalyticsRollup.soil_type == soil_type)
+
+        result = await self.read_db.execute(statement)
+        return result.mappings().all()
@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class SoilTypeBucketStats(BaseModel):
+    """One soil type within a time bucket"""
+    soil_type: str
+    count: int
+    share: float  # % of the bucket's analyses
+    mean_confidence: float
+
+
+class AnalyticsBucket(BaseModel):
+    """Analyses of all users in one day / week"""
+    bucket: datetime
+    total: int
+    soil_types: list[SoilTypeBucketStats]
+
+
+class AnalyticsResponse(BaseModel):
+    """Soil type distribution over time, from rollup tables"""
+    period: Literal["day", "week"]
+    buckets: list[AnalyticsBucket]
@@ -1,24 +1,42 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter, computed_field, model_validator
 from datetime import datetime
 
+from app.core.config import settings
+
 
 class SoilAnalysisResponse(BaseModel):
     """Response schema for soil analysis"""
     id: int
-    user_id: int
     image_filename: str
-    image_path: str
+    image_path: str = Field(exclude=True)  # storage key, internal
+    original_image_path: str | None = Field(default=None, exclude=True)
     soil_type: str
     confidence: float
     description: str
     characteristics: str
     recommended_crops: str
     recommendations: str
+    model_version: str | None = None
+    cascade_stage: str | None = None
+    duplicate_of: int | None = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+    @computed_field
+    @property
+    def image_url(self) -> str:
+        # Без публичного /uploads - через эндпоинт с проверкой владельца
+        if not settings.UPLOADS_PUBLIC:
+            return f"/api/v1/soil/image/{self.id}"
+        return f"/{self.image_path}"
+
+    @computed_field
+    @property
+    def has_original(self) -> bool:
+        return self.original_image_path is not None
+
 
 class SoilAnalysisListResponse(BaseModel):
     """Response schema for list of soil analyses"""
@@ -26,6 +44,34 @@ class SoilAnalysisListResponse(BaseModel):
     total: int
 
 
+# Validation and serialization of a whole page of analyses in one pydantic-core call
+soil_analysis_list = TypeAdapter(list[SoilAnalysisResponse])
+
+
+def dump_analyses(rows) -> list[dict]:
+    """JSON-ready dicts of analyses from row mappings (or ORM objects, from_attributes)"""
+    return soil_analysis_list.dump_python(soil_analysis_list.validate_python(rows, from_attributes=True), mode="json")
+
+
+class BulkDeleteRequest(BaseModel):
+    """Analyses to delete: by ids, by created_at range [created_from, created_to), or both"""
+    ids: list[int] | None = Field(default=None, max_length=10000)
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+    @model_validator(mode="after")
+    def require_criteria(self):
+        if self.ids is None and self.created_from is None and self.created_to is None:
+            raise ValueError("Specify ids or a created_from/created_to range")
+        return self
+
+
+class BulkDeleteResponse(BaseModel):
+    """Result of a bulk delete"""
+    deleted: int
+    ids: list[int]
+
+
 class SoilPrediction(BaseModel):
     """Schema for ML model prediction"""
     soil_type: str
@@ -34,6 +80,9 @@ class SoilPrediction(BaseModel):
     characteristics: str
     recommended_crops: str
     recommendations: str
+    model_version: str | None = None
+    embedding: list[float] | None = None  # penultimate layer activations, for similarity search
+    cascade_stage: str | None = None  # "fast" / "full" when the model cascade is on
 
 
 class SoilTypeStats(BaseModel):
@@ -49,3 +98,24 @@ class UserStatsResponse(BaseModel):
     soil_types_breakdown: list[SoilTypeStats]
     most_common_type: str | None
     latest_analysis_date: datetime | None
+
+
+class ModelActivateRequest(BaseModel):
+    """Request to activate (and hot-reload) a registered model version"""
+    version: str
+
+
+class SimilarAnalysisItem(BaseModel):
+    """Analysis that looks similar to the requested one"""
+    similarity: float
+    soil_type: str
+    confidence: float
+    created_at: datetime
+    analysis_id: int | None = None  # only for the user's own analyses
+
+
+class SimilarAnalysesResponse(BaseModel):
+    """Nearest neighbours of an analysis by CNN embedding"""
+    analysis_id: int
+    scope: str
+    results: list[SimilarAnalysisItem]
@@ -0,0 +1,99 @@
+"""
+Soil type analytics across users
+
+Raw soil_analyses are aggregated into soil_analytics_rollups: one row per
+(period, date_trunc bucket, soil type) with the count and the sum of
+confidences. The admin analytics API reads only the rollups, so a year of
+weekly buckets is a few hundred rows regardless of how many analyses there are.
+
+A periodic job (ANALYTICS_ROLLUP_INTERVAL, one worker at a time via an
+advisory lock) recomputes the buckets of the last ANALYTICS_ROLLUP_LOOKBACK_DAYS;
+an empty table is filled completely on the first run. Deletes of analyses
+older than the lookback window are picked up by a full rebuild:
+
+    python -m app.services.analytics refresh   # lookback window
+    python -m app.services.analytics rebuild   # everything
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.schemas.analytics import AnalyticsBucket, SoilTypeBucketStats
+
+PERIODS = ("day", "week")
+
+
+def bucket_start(period: str, moment: datetime) -> datetime:
+    """date_trunc(period, moment) in Python (weeks start on Monday, as in PostgreSQL)"""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def build_buckets(rows) -> list[AnalyticsBucket]:
+    """Rollup rows (ordered by bucket) -> per-bucket soil type breakdown"""
+    buckets: list[AnalyticsBucket] = []
+    for row in rows:
+        if not buckets or buckets[-1].bucket != row["bucket"]:
+            buckets.append(AnalyticsBucket(bucket=row["bucket"], total=0, soil_types=[]))
+        current = buckets[-1]
+        current.total += row["count"]
+        current.soil_types.append(SoilTypeBucketStats(
+            soil_type=row["soil_type"],
+            count=row["count"],
+            share=0.0,
+            mean_confidence=round(row["confidence_sum"] / row["count"], 4)
+        ))
+
+    for current in buckets:
+        current.soil_types.sort(key=lambda item: item.count, reverse=True)
+        for item in current.soil_types:
+            item.share = round(item.count / current.total * 100, 1)
+    return buckets
+
+
+async def refresh_rollups(repo, lookback_days: float | None) -> dict:
+    """Recompute rollups of every period; lookback_days=None (or an empty table) - full rebuild"""
+    if lookback_days is not None and not await repo.has_analytics_rollups():
+        lookback_days = None
+
+    now = datetime.utcnow()
+    refreshed = {}
+    for period in PERIODS:
+        since = bucket_start(period, now - timedelta(days=lookback_days)) if lookback_days is not None else None
+        refreshed[period] = await repo.refresh_analytics_rollups(period, since)
+    return refreshed
+
+
+async def run_analytics_rollups(interval: float):
+    """Periodic rollup refresh (every worker runs it, the advisory lock lets one through)"""
+    from app.db.session import AsyncSessionLocal
+    from app.repository.postgres import DatabaseRepo
+
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await refresh_rollups(DatabaseRepo(session), settings.ANALYTICS_ROLLUP_LOOKBACK_DAYS)
+        except Exception as e:
+            print(f"Analytics rollup failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command in ("refresh", "rebuild"):
+        from app.db.session import AsyncSessionLocal
+        from app.repository.postgres import DatabaseRepo
+
+        async def main():
+            async with AsyncSessionLocal() as session:
+                lookback = settings.ANALYTICS_ROLLUP_LOOKBACK_DAYS if command == "refresh" else None
+                return await refresh_rollups(DatabaseRepo(session), lookback)
+
+        print(asyncio.run(main()))
+    else:
+        print("Usage: python -m app.services.analytics refresh|rebuild")
+        sys.exit(1)
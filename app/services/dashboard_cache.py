@@ -0,0 +1,173 @@
+"""
+Write-through Redis cache of the per-user dashboard
+
+One orjson blob per user, `dashboard:{user_id}`:
+    {"recent": [latest DASHBOARD_CACHE_SIZE analyses], "total": int, "stats": UserStatsResponse}
+
+It is rebuilt from Postgres by DatabaseRepo after every save/delete of an
+analysis, so `GET /soil/history` (first page, limit <= DASHBOARD_CACHE_SIZE)
+and `GET /soil/stats` are answered from one Redis GET. A miss (first visit,
+expired TTL, Redis restart) rebuilds the blob once.
+
+Concurrent rebuilds are ordered by a per-user version counter,
+`dashboard:{user_id}:v`: a change bumps it and drops the blob before
+rebuilding, and a blob is stored only if the version it was built under is
+still current (checked atomically in Lua). A snapshot built before a later
+change can therefore never overwrite a newer one.
+
+Redis errors never fail a request: reads fall back to Postgres, and after
+an error Redis is skipped for RATE_LIMIT_FAIL_OPEN_SECONDS (RedisBreaker).
+A change made while Redis is unreachable cannot drop the blob; it stays
+stale for at most DASHBOARD_CACHE_TTL.
+"""
+from collections import Counter
+from typing import Optional
+
+import orjson
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.schemas.soil import SoilTypeStats, UserStatsResponse, dump_analyses
+from app.services.redis_client import RedisBreaker, get_redis
+
+# SET блоба, только если версия не менялась с начала сборки
+# KEYS[1] - блоб, KEYS[2] - версия; ARGV: ожидаемая версия, блоб, TTL
+SET_IF_VERSION_LUA = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def build_stats(total: int, soil_type_counts: dict[str, int], latest_date) -> UserStatsResponse:
+    """Stats summary from per-type counts"""
+    counts = Counter(soil_type_counts)
+    breakdown = [
+        SoilTypeStats(
+            soil_type=soil_type,
+            count=count,
+            percentage=round((count / total) * 100, 1)
+        )
+        for soil_type, count in counts.most_common()
+    ] if total else []
+
+    return UserStatsResponse(
+        total_analyses=total,
+        soil_types_breakdown=breakdown,
+        most_common_type=breakdown[0].soil_type if breakdown else None,
+        latest_analysis_date=latest_date
+    )
+
+
+async def build_dashboard(repo, user_id: int) -> dict:
+    """Dashboard blob from Postgres: three small queries instead of a full history scan"""
+    recent = await repo.get_user_soil_analysis_rows(user_id, limit=settings.DASHBOARD_CACHE_SIZE, offset=0)
+    soil_type_counts = await repo.count_user_analyses_by_soil_type(user_id)
+    total = sum(soil_type_counts.values())
+    latest_date = recent[0]["created_at"] if recent else None
+
+    return {
+        "recent": dump_analyses(recent),
+        "total": total,
+        "stats": build_stats(total, soil_type_counts, latest_date).model_dump(mode="json"),
+    }
+
+
+class DashboardCache:
+    def __init__(self):
+        self.redis = get_redis()
+        self._set_if_version = self.redis.register_script(SET_IF_VERSION_LUA)
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"dashboard:{user_id}"
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"dashboard:{user_id}:v"
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        if RedisBreaker.is_open():
+            return None
+        try:
+            data = await self.redis.get(self._key(user_id))
+        except (RedisError, OSError):
+            RedisBreaker.trip()
+            return None
+        return orjson.loads(data) if data is not None else None
+
+    async def version(self, user_id: int) -> Optional[str]:
+        """Current version of the user's dashboard (None - Redis unavailable)"""
+        if RedisBreaker.is_open():
+            return None
+        try:
+            return await self.redis.get(self._version_key(user_id)) or "0"
+        except (RedisError, OSError):
+            RedisBreaker.trip()
+            return None
+
+    async def set(self, user_id: int, dashboard: dict, version: str):
+        """Store the blob if nothing changed since `version` was read"""
+        if RedisBreaker.is_open():
+            return
+        try:
+            await self._set_if_version(
+                keys=[self._key(user_id), self._version_key(user_id)],
+                args=[version, orjson.dumps(dashboard), settings.DASHBOARD_CACHE_TTL]
+            )
+        except (RedisError, OSError):
+            RedisBreaker.trip()
+
+    async def invalidate(self, user_id: int) -> Optional[str]:
+        """Bump the version and drop the blob; returns the new version (None - Redis unavailable)"""
+        if RedisBreaker.is_open():
+            return None
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._version_key(user_id))
+                pipe.expire(self._version_key(user_id), settings.DASHBOARD_CACHE_TTL)
+                pipe.delete(self._key(user_id))
+                version, _, _ = await pipe.execute()
+        except (RedisError, OSError):
+            # Устаревшая запись проживёт не дольше DASHBOARD_CACHE_TTL
+            RedisBreaker.trip()
+            return None
+        return str(version)
+
+    async def refresh(self, repo, user_id: int):
+        """Write-through after a change of the user's analyses (never raises: the change is already committed)"""
+        version = await self.invalidate(user_id)
+        if version is None:
+            return
+        try:
+            dashboard = await build_dashboard(repo, user_id)
+        except Exception:
+            # Блоб уже удалён - следующее чтение соберёт его заново
+            return
+        await self.set(user_id, dashboard, version)
+
+    async def get_or_build(self, repo, user_id: int) -> dict:
+        dashboard = await self.get(user_id)
+        if dashboard is None:
+            # Версию читаем до сборки: изменение во время сборки не даст записать старый снимок
+            version = await self.version(user_id)
+            dashboard = await build_dashboard(repo, user_id)
+            if version is not None:
+                await self.set(user_id, dashboard, version)
+        return dashboard
+
+
+# Singleton instance
+_dashboard_cache: Optional[DashboardCache] = None
+
+
+def get_dashboard_cache() -> Optional[DashboardCache]:
+    """Get singleton instance of dashboard cache (None if DASHBOARD_CACHE_ENABLED is off)"""
+    global _dashboard_cache
+    if not settings.DASHBOARD_CACHE_ENABLED:
+        return None
+    if _dashboard_cache is None:
+        _dashboard_cache = DashboardCache()
+    return _dashboard_cache
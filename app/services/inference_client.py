@@ -0,0 +1,186 @@
+"""
+Client for the local inference server (INFERENCE_MODE=remote)
+
+API workers preprocess the image straight into a shared memory segment and
+send only a small JSON header over a Unix socket; the inference server maps
+the same segment as a NumPy array without copying. Each thread keeps its own
+connection and segment, created once and reused for every request.
+
+Wire format: 4-byte big-endian length + UTF-8 JSON, in both directions.
+"""
+import atexit
+import json
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.schemas.soil import SoilPrediction
+from app.services import preprocessing
+from app.services.model_registry import ModelRegistry
+
+_HEADER = struct.Struct("!I")
+TENSOR_DTYPE = np.float32
+TENSOR_SHAPE = (1, *preprocessing.INPUT_SHAPE)
+TENSOR_NBYTES = int(np.prod(TENSOR_SHAPE)) * np.dtype(TENSOR_DTYPE).itemsize
+
+
+def send_frame(sock: socket.socket, message: dict):
+    payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:], size - received)
+        if chunk == 0:
+            raise ConnectionError("Inference server closed the connection")
+        received += chunk
+    return bytes(buffer)
+
+
+def recv_frame(sock: socket.socket) -> dict:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+class _Connection:
+    """Socket + shared memory segment owned by one thread"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.shm = shared_memory.SharedMemory(create=True, size=TENSOR_NBYTES)
+        self.tensor = np.ndarray(TENSOR_SHAPE, dtype=TENSOR_DTYPE, buffer=self.shm.buf)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(socket_path)
+            self.request({"op": "attach", "shm": self.shm.name, "nbytes": TENSOR_NBYTES})
+        except Exception:
+            self.close()
+            raise
+
+    def request(self, message: dict) -> dict:
+        send_frame(self.sock, message)
+        response = recv_frame(self.sock)
+        if "error" in response:
+            raise RuntimeError(f"Inference server error: {response['error']}")
+        return response
+
+    def close(self):
+        try:
+            self.sock.close()
+        finally:
+            # Сегмент создан этим процессом - он его и удаляет
+            self.tensor = None
+            self.shm.close()
+            self.shm.unlink()
+
+
+class RemoteSoilMLService:
+    """Drop-in replacement for SoilMLService that delegates inference to the server"""
+
+    def __init__(self, socket_path: str, timeout: float):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.registry = ModelRegistry(Path("app/ml_model"))
+        self.model_version: Optional[str] = None
+        self._local = threading.local()
+        self._connections: list[_Connection] = []
+        self._connections_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _connection(self) -> _Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _Connection(self.socket_path, self.timeout)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = self._local.__dict__.pop("conn", None)
+        if conn is not None:
+            with self._connections_lock:
+                self._connections.remove(conn)
+            conn.close()
+
+    def _request(self, message: dict, fill=None) -> dict:
+        # Одна повторная попытка: сервер мог перезапуститься
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                if fill is not None:
+                    fill(conn.tensor)
+                return conn.request(message)
+            except ConnectionError:
+                self._drop_connection()
+                if attempt == 1:
+                    raise
+            except OSError:
+                # Таймаут: поздний ответ сбил бы протокол, соединение не переиспользуем
+                self._drop_connection()
+                raise
+
+    def preprocess_image(self, image_path: str | BinaryIO) -> np.ndarray:
+        return preprocessing.preprocess_image(image_path)
+
+    def predict(self, image_path: str | BinaryIO) -> SoilPrediction:
+        """Preprocess into shared memory and run inference on the server"""
+        response = self._request(
+            {"op": "predict"},
+            fill=lambda tensor: preprocessing.preprocess_image(image_path, out=tensor)
+        )
+        return self._served(SoilPrediction(**response["prediction"]))
+
+    def predict_array(self, img_array: np.ndarray) -> SoilPrediction:
+        def fill(tensor: np.ndarray):
+            tensor[...] = img_array
+
+        response = self._request({"op": "predict"}, fill=fill)
+        return self._served(SoilPrediction(**response["prediction"]))
+
+    def _served(self, prediction: SoilPrediction) -> SoilPrediction:
+        # Версия основной модели сервера; ответы быстрой ступени каскада несут версию быстрой модели
+        if prediction.cascade_stage != "fast":
+            self.model_version = prediction.model_version
+        return prediction
+
+    def reload(self, version: Optional[str] = None) -> str:
+        """Ask the server to load, warm up and swap in a model version"""
+        response = self._request({"op": "reload", "version": version})
+        self.model_version = response["version"]
+        return self.model_version
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+# Singleton instance
+_remote_instance: Optional[RemoteSoilMLService] = None
+
+
+def get_remote_ml_service() -> RemoteSoilMLService:
+    """Get singleton instance of inference server client"""
+    global _remote_instance
+    if _remote_instance is None:
+        _remote_instance = RemoteSoilMLService(
+            socket_path=settings.INFERENCE_SOCKET_PATH,
+            timeout=settings.INFERENCE_SERVER_TIMEOUT
+        )
+    return _remote_instance
@@ -0,0 +1,126 @@
+"""
+Admission control for the inference path
+
+Bounds the number of concurrent predictions per process, keeps a short wait
+queue in front of them and rejects new work immediately (503 + Retry-After)
+once the queue is full or the projected wait is too long. A per-user cap
+(429 + Retry-After) stops a single bulk uploader from taking every slot.
+
+Limits are per worker process: with `uvicorn --workers N` the effective
+capacity is N * INFERENCE_MAX_CONCURRENCY.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+
+class InferenceLimiter:
+    """Bounded concurrency + queue with fast rejection"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        max_wait_seconds: float,
+        max_per_user: int,
+        initial_duration: float = 1.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.max_per_user = max_per_user
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._active = 0
+        self._waiting = 0
+        self._per_user: dict[int, int] = {}
+        # Скользящее среднее длительности инференса (EWMA), сек
+        self._avg_duration = initial_duration
+
+    def projected_wait(self) -> float:
+        """Expected wait for a request admitted right now, seconds"""
+        ahead = self._active + self._waiting - self.max_concurrency + 1
+        if ahead <= 0:
+            return 0.0
+        return ahead * self._avg_duration / self.max_concurrency
+
+    def _retry_after(self) -> str:
+        return str(max(1, math.ceil(self.projected_wait() or self._avg_duration)))
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "avg_duration": round(self._avg_duration, 4),
+            "projected_wait": round(self.projected_wait(), 4),
+        }
+
+    @asynccontextmanager
+    async def slot(self, user_id: int) -> AsyncIterator[None]:
+        """Hold an inference slot for the duration of the block"""
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many concurrent analyses for this user",
+                headers={"Retry-After": self._retry_after()}
+            )
+
+        if self._waiting >= self.max_queue or self.projected_wait() > self.max_wait_seconds:
+            raise HTTPException(
+                status_code=503,
+                detail="Inference queue is full, try again later",
+                headers={"Retry-After": self._retry_after()}
+            )
+
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        try:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait_seconds)
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Inference queue wait timed out, try again later",
+                    headers={"Retry-After": self._retry_after()}
+                )
+            finally:
+                self._waiting -= 1
+
+            self._active += 1
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._active -= 1
+                self._semaphore.release()
+                duration = time.perf_counter() - started
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        finally:
+            self._per_user[user_id] -= 1
+            if self._per_user[user_id] <= 0:
+                del self._per_user[user_id]
+
+
+# Singleton instance
+_limiter_instance: Optional[InferenceLimiter] = None
+
+
+def get_inference_limiter() -> InferenceLimiter:
+    """Get singleton instance of inference limiter"""
+    global _limiter_instance
+    if _limiter_instance is None:
+        _limiter_instance = InferenceLimiter(
+            max_concurrency=settings.INFERENCE_MAX_CONCURRENCY,
+            max_queue=settings.INFERENCE_MAX_QUEUE,
+            max_wait_seconds=settings.INFERENCE_MAX_WAIT_SECONDS,
+            max_per_user=settings.INFERENCE_MAX_PER_USER
+        )
+    return _limiter_instance
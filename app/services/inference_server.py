@@ -0,0 +1,128 @@
+"""
+Local inference server: one process owns TensorFlow and the model
+
+Run next to the API workers:
+    python -m app.services.inference_server
+    INFERENCE_MODE=remote uvicorn app.main:app --workers 8
+
+API workers (see inference_client) attach a shared memory segment per
+connection; the server maps it as a NumPy array without copying and returns
+the prediction as JSON over the same Unix socket. Each connection is served
+by its own thread. With MODEL_WATCH_INTERVAL > 0 the server follows the
+registry manifest and hot-reloads like an in-process worker would; with
+MEMORY_LIMIT_MB > 0 it watches its RSS (app.core.memory).
+"""
+import os
+import socketserver
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.memory import MemoryGuard
+from app.services.inference_client import TENSOR_DTYPE, TENSOR_NBYTES, TENSOR_SHAPE, recv_frame, send_frame
+from app.services.ml_service import SoilMLService
+
+service = SoilMLService()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach a client-owned segment without taking ownership of its lifetime"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: иначе resource_tracker удалит сегмент клиента при выходе сервера
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class InferenceRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        shm = None
+        tensor = None
+        try:
+            while True:
+                try:
+                    message = recv_frame(self.request)
+                except ConnectionError:
+                    return
+
+                try:
+                    op = message.get("op")
+                    if op == "attach":
+                        if message["nbytes"] != TENSOR_NBYTES:
+                            raise ValueError("Tensor size mismatch between client and server")
+                        shm = _attach(message["shm"])
+                        tensor = np.ndarray(TENSOR_SHAPE, dtype=TENSOR_DTYPE, buffer=shm.buf)
+                        send_frame(self.request, {"ok": True})
+                    elif op == "predict":
+                        if tensor is None:
+                            raise ValueError("No shared memory attached")
+                        prediction = service.predict_array(tensor)
+                        send_frame(self.request, {"prediction": prediction.model_dump()})
+                    elif op == "reload":
+                        version = service.reload(message.get("version"))
+                        send_frame(self.request, {"version": version})
+                    elif op == "ping":
+                        send_frame(self.request, {"version": service.model_version})
+                    else:
+                        raise ValueError(f"Unknown op: {op}")
+                except Exception as e:
+                    send_frame(self.request, {"error": str(e)})
+        finally:
+            tensor = None
+            if shm is not None:
+                shm.close()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _watch_manifest(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            active = service.registry.active_version()
+            if active != service.model_version:
+                service.reload(active)
+                print(f"Model reloaded: {active}")
+        except Exception as e:
+            print(f"Model reload failed: {e}")
+
+
+def _watch_memory(interval: float):
+    guard = MemoryGuard(settings.MEMORY_LIMIT_MB, settings.MEMORY_LIMIT_ACTION, service)
+    while True:
+        time.sleep(interval)
+        if not guard.check():
+            return
+
+
+def serve(socket_path: str):
+    service.load_model()
+    print(f"Model loaded: {service.model_version}")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    if settings.MODEL_WATCH_INTERVAL > 0:
+        threading.Thread(target=_watch_manifest, args=(settings.MODEL_WATCH_INTERVAL,), daemon=True).start()
+
+    if settings.MEMORY_LIMIT_MB > 0:
+        threading.Thread(target=_watch_memory, args=(settings.MEMORY_CHECK_INTERVAL,), daemon=True).start()
+
+    with InferenceServer(socket_path, InferenceRequestHandler) as server:
+        os.chmod(socket_path, 0o660)
+        print(f"Inference server listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve(settings.INFERENCE_SOCKET_PATH)
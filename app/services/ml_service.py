@@ -1,110 +1,378 @@
 """
 Service for working with ML model for soil classification
+
+TensorFlow and NumPy are imported on first use, not at module load, so that
+importing the API (and workers with ML_ENABLED=false) stays cheap.
 """
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
+import asyncio
 import json
-import numpy as np
-from PIL import Image
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-import tensorflow as tf
-from typing import Optional
+from typing import TYPE_CHECKING, BinaryIO, Callable, Optional
+
+from fastapi import HTTPException
+
+from fastapi.concurrency import run_in_threadpool
 
+from app.core.config import settings
 from app.schemas.soil import SoilPrediction
+from app.services.model_registry import ModelRegistry
+from app.services import preprocessing
+
+if TYPE_CHECKING:
+    import numpy as np
+    import tensorflow as tf
+
+
+_tf_configured = False
+_tf_config_lock = threading.Lock()
+
+
+def configure_tensorflow():
+    """Apply TF_* settings once per process, before TensorFlow initializes its runtime"""
+    global _tf_configured
+    with _tf_config_lock:
+        if _tf_configured:
+            return
+
+        # Читается при импорте TensorFlow
+        if settings.TF_ENABLE_ONEDNN is not None:
+            os.environ["TF_ENABLE_ONEDNN_OPTS"] = "1" if settings.TF_ENABLE_ONEDNN else "0"
+
+        import tensorflow as tf
+
+        try:
+            if settings.TF_INTRA_OP_THREADS:
+                tf.config.threading.set_intra_op_parallelism_threads(settings.TF_INTRA_OP_THREADS)
+            if settings.TF_INTER_OP_THREADS:
+                tf.config.threading.set_inter_op_parallelism_threads(settings.TF_INTER_OP_THREADS)
+        except RuntimeError as e:
+            print(f"TensorFlow thread settings not applied (runtime already initialized): {e}")
+
+        print(
+            f"TensorFlow {tf.__version__}: "
+            f"intra_op_threads={tf.config.threading.get_intra_op_parallelism_threads() or 'auto'}, "
+            f"inter_op_threads={tf.config.threading.get_inter_op_parallelism_threads() or 'auto'}, "
+            f"onednn={os.environ.get('TF_ENABLE_ONEDNN_OPTS', 'default')}, "
+            f"compiled_inference={settings.TF_COMPILED_INFERENCE}, xla={settings.TF_USE_XLA}"
+        )
+        _tf_configured = True
+
+
+def build_inference_fn(model: "tf.keras.Model", height: int, width: int, jit_compile: bool = False):
+    """
+    Compiled forward pass with a fixed input signature.
+
+    Unlike model.predict() it does not rebuild the data adapter on every call
+    and never retraces for a batch of a different size.
+    """
+    import tensorflow as tf
+
+    @tf.function(
+        input_signature=[tf.TensorSpec(shape=[None, height, width, 3], dtype=tf.float32)],
+        jit_compile=jit_compile
+    )
+    def infer(images):
+        return model(images, training=False)
+
+    return infer
+
+
+def with_embedding_output(model: "tf.keras.Model") -> Optional["tf.keras.Model"]:
+    """
+    Same network returning (probabilities, penultimate Dense activations).
+
+    Both come out of one forward pass. Returns None if the model has no
+    hidden Dense layer to take the embedding from.
+    """
+    import tensorflow as tf
+
+    dense_layers = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    if len(dense_layers) < 2:
+        return None
+    try:
+        return tf.keras.Model(inputs=model.inputs, outputs=[model.outputs[0], dense_layers[-2].output])
+    except (AttributeError, ValueError) as e:
+        print(f"Embedding output not available: {e}")
+        return None
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """Model together with its class mapping, swapped as one unit"""
+    version: str
+    model: "tf.keras.Model"
+    class_mapping: dict
+    infer: Optional[Callable] = None  # compiled forward pass (TF_COMPILED_INFERENCE)
+    serving_model: Optional["tf.keras.Model"] = None  # model + embedding output
+
+    def run_full(self, img_array: "np.ndarray") -> tuple["np.ndarray", Optional["np.ndarray"]]:
+        """(class probabilities, embeddings or None) for a preprocessed float32 batch"""
+        if self.infer is not None:
+            outputs = self.infer(img_array)
+            outputs = [o.numpy() for o in outputs] if isinstance(outputs, (list, tuple)) else outputs.numpy()
+        else:
+            outputs = (self.serving_model or self.model).predict(img_array, verbose=0)
+
+        if self.serving_model is not None:
+            probabilities, embeddings = outputs
+            return probabilities, embeddings
+        return outputs, None
+
+    def run(self, img_array: "np.ndarray") -> "np.ndarray":
+        """Class probabilities for a preprocessed float32 batch"""
+        return self.run_full(img_array)[0]
 
 
 class SoilMLService:
     """Service for soil classification using trained ML model"""
 
     def __init__(self):
-        self.model: Optional[tf.keras.Model] = None
-        self.class_mapping: Optional[dict] = None
+        self.current: Optional[LoadedModel] = None
+        # Маленькая модель первой ступени каскада (CASCADE_FAST_VERSION)
+        self.fast: Optional[LoadedModel] = None
+        self.cascade_counts = {"fast": 0, "escalated": 0}
         self.model_path = Path("app/ml_model")
-        self.img_height = 224
-        self.img_width = 224
+        self.registry = ModelRegistry(self.model_path)
+        self.img_height = preprocessing.IMG_HEIGHT
+        self.img_width = preprocessing.IMG_WIDTH
+        self._load_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+
+    @property
+    def model(self) -> Optional["tf.keras.Model"]:
+        return self.current.model if self.current else None
+
+    @property
+    def class_mapping(self) -> Optional[dict]:
+        return self.current.class_mapping if self.current else None
+
+    @property
+    def model_version(self) -> Optional[str]:
+        """Version of the served model; part of any prediction cache key"""
+        return self.current.version if self.current else None
+
+    def _load_version(self, version: Optional[str] = None) -> LoadedModel:
+        """Load and warm up a model version without touching the served one"""
+        configure_tensorflow()
+
+        import numpy as np
+        import tensorflow as tf
+
+        files = self.registry.resolve(version)
+
+        with open(files.class_mapping_file, "r", encoding="utf-8") as f:
+            class_mapping = json.load(f)
+
+        model = tf.keras.models.load_model(str(files.model_file))
+
+        serving_model = with_embedding_output(model)
+
+        infer = None
+        if settings.TF_COMPILED_INFERENCE:
+            infer = build_inference_fn(
+                serving_model or model, self.img_height, self.img_width, jit_compile=settings.TF_USE_XLA
+            )
+
+        loaded = LoadedModel(
+            version=files.version,
+            model=model,
+            class_mapping=class_mapping,
+            infer=infer,
+            serving_model=serving_model
+        )
+
+        # Warm-up: первый вызов строит граф, пусть это будет не запрос пользователя
+        loaded.run(np.zeros((1, self.img_height, self.img_width, 3), dtype=np.float32))
+
+        return loaded
+
+    def _load_fast(self, full: LoadedModel) -> Optional[LoadedModel]:
+        """Fast first-stage model of the cascade, if configured and compatible with the full one"""
+        if not settings.CASCADE_FAST_VERSION or settings.CASCADE_FAST_VERSION == full.version:
+            return None
+        try:
+            fast = self._load_version(settings.CASCADE_FAST_VERSION)
+        except Exception as e:
+            # Неизвестная/битая версия не должна мешать основной модели
+            print(f"Cascade disabled: fast model {settings.CASCADE_FAST_VERSION} failed to load: {e}")
+            return None
+        if fast.class_mapping["class_names"] != full.class_mapping["class_names"]:
+            print(f"Cascade disabled: {fast.version} and {full.version} have different classes")
+            return None
+        return fast
 
     def load_model(self):
-        """Load the trained model and class mapping"""
-        if self.model is None:
-            model_file = self.model_path / "best_model.keras"
-            if not model_file.exists():
-                model_file = self.model_path / "soil_classifier.keras"
+        """Load the active model version and class mapping"""
+        # predict() runs in threadpool workers: load only once
+        with self._load_lock:
+            if self.current is not None:
+                return
+            self.current = self._load_version()
+            self.fast = self._load_fast(self.current)
+
+    def reload(self, version: Optional[str] = None) -> str:
+        """
+        Load a model version (active one by default) in the calling thread,
+        warm it up and atomically swap it in. In-flight predictions finish
+        on the model they started with.
+        """
+        with self._load_lock:
+            loaded = self._load_version(version)
+            fast = self.fast
+            if (
+                fast is None
+                or fast.version == loaded.version
+                or fast.class_mapping["class_names"] != loaded.class_mapping["class_names"]
+            ):
+                fast = self._load_fast(loaded)
+            self.current = loaded
+            self.fast = fast
+        return loaded.version
 
-            self.model = tf.keras.models.load_model(str(model_file))
+    def clear_session(self) -> Optional[str]:
+        """
+        Drop Keras global state and reload the served model(s) from disk
+
+        Frees graphs and tensors accumulated by tf.function retraces and
+        earlier reloads. Requests arriving meanwhile wait on the load lock.
+        """
+        import gc
+        import tensorflow as tf
 
-            # Load class mapping
-            with open(self.model_path / "class_mapping.json", "r", encoding="utf-8") as f:
-                self.class_mapping = json.load(f)
+        with self._load_lock:
+            if self.current is None:
+                return None
+            version = self.current.version
+            self.current = None
+            self.fast = None
+            tf.keras.backend.clear_session()
+            gc.collect()
+            self.current = self._load_version(version)
+            self.fast = self._load_fast(self.current)
+        return version
 
-    def preprocess_image(self, image_path: str) -> np.ndarray:
+    def preprocess_image(self, image_path: str | BinaryIO) -> "np.ndarray":
         """
         Preprocess image for model prediction
 
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file or a binary file object
 
         Returns:
             Preprocessed image array
         """
-        # Load image
-        img = Image.open(image_path)
+        return preprocessing.preprocess_image(image_path)
 
-        # Convert to RGB if necessary
-        if img.mode != "RGB":
-            img = img.convert("RGB")
+    def predict(self, image_path: str | BinaryIO) -> SoilPrediction:
+        """
+        Predict soil type from image
 
-        # Resize
-        img = img.resize((self.img_width, self.img_height))
+        Args:
+            image_path: Path to the soil image or a binary file object
 
-        # Convert to array and normalize
-        img_array = np.array(img)
-        img_array = img_array / 255.0
+        Returns:
+            SoilPrediction with soil type and recommendations
+        """
+        return self.predict_array(self.preprocess_image(image_path))
 
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
+    def predict_array(self, img_array: "np.ndarray") -> SoilPrediction:
+        """
+        Predict soil type from a preprocessed (1, H, W, 3) batch
 
-        return img_array
+        Args:
+            img_array: Output of preprocess_image (may be a shared memory view)
 
-    def predict(self, image_path: str) -> SoilPrediction:
+        Returns:
+            SoilPrediction with soil type and recommendations
         """
-        Predict soil type from image
+        return self.predict_batch(img_array)[0]
+
+    def predict_batch(self, img_batch: "np.ndarray") -> list[SoilPrediction]:
+        """
+        Predict soil types for a preprocessed (N, H, W, 3) float32 batch
 
         Args:
-            image_path: Path to the soil image
+            img_batch: Stacked preprocessed images
 
         Returns:
-            SoilPrediction with soil type and recommendations
+            One SoilPrediction per image, in order
         """
-        # Load model if not loaded
-        if self.model is None:
-            self.load_model()
+        import numpy as np
 
-        # Preprocess image
-        img_array = self.preprocess_image(image_path)
+        # Pin the model for this call: reload() / clear_session() may swap self.current meanwhile
+        loaded = self.current
+        if loaded is None:
+            # Load model if not loaded
+            self.load_model()
+            loaded = self.current
+        fast = self.fast
 
         # Make prediction
-        predictions = self.model.predict(img_array, verbose=0)
-
-        # Get predicted class and confidence
-        predicted_class_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class_idx])
-
-        # Get class name
-        class_names = self.class_mapping["class_names"]
-        predicted_soil_type = class_names[predicted_class_idx]
-
-        # Get soil information
-        soil_info = self.class_mapping["soil_info"][predicted_soil_type]
-
-        return SoilPrediction(
-            soil_type=predicted_soil_type,
-            confidence=confidence,
-            description=soil_info["description"],
-            characteristics=soil_info["characteristics"],
-            recommended_crops=soil_info["crops"],
-            recommendations=soil_info["recommendations"]
-        )
+        if fast is None:
+            predictions, embeddings = loaded.run_full(img_batch)
+            stages = None
+        else:
+            predictions, embeddings, stages = self._run_cascade(fast, loaded, img_batch)
+
+        class_names = loaded.class_mapping["class_names"]
+        results = []
+        for i, probabilities in enumerate(predictions):
+            stage = stages[i] if stages is not None else None
+            # Get predicted class and confidence
+            predicted_class_idx = int(np.argmax(probabilities))
+            confidence = float(probabilities[predicted_class_idx])
+
+            # Get class name
+            predicted_soil_type = class_names[predicted_class_idx]
+
+            # Get soil information
+            soil_info = loaded.class_mapping["soil_info"][predicted_soil_type]
+
+            results.append(SoilPrediction(
+                soil_type=predicted_soil_type,
+                confidence=confidence,
+                description=soil_info["description"],
+                characteristics=soil_info["characteristics"],
+                recommended_crops=soil_info["crops"],
+                recommendations=soil_info["recommendations"],
+                # Ответ быстрой модели помечается её версией: повторное использование и аналитика их различают
+                model_version=fast.version if stage == "fast" else loaded.version,
+                embedding=embeddings[i].tolist() if embeddings is not None and embeddings[i] is not None else None,
+                cascade_stage=stage
+            ))
+
+        return results
+
+    def _run_cascade(self, fast: LoadedModel, full: LoadedModel, img_batch: "np.ndarray"):
+        """
+        Fast model for the whole batch, full model only for images below CASCADE_THRESHOLD
+
+        Embeddings come from the full model only (the index holds one embedding
+        space), so images answered by the fast model get none.
+        """
+        import numpy as np
+
+        probabilities = np.array(fast.run(img_batch))
+        escalate = probabilities.max(axis=1) < settings.CASCADE_THRESHOLD
+        embeddings = [None] * len(probabilities)
+
+        if escalate.any():
+            full_probabilities, full_embeddings = full.run_full(img_batch[escalate])
+            probabilities[escalate] = full_probabilities
+            if full_embeddings is not None:
+                for row, embedding in zip(np.flatnonzero(escalate), full_embeddings):
+                    embeddings[row] = embedding
+
+        escalated = int(escalate.sum())
+        with self._counts_lock:
+            self.cascade_counts["escalated"] += escalated
+            self.cascade_counts["fast"] += len(probabilities) - escalated
+        return probabilities, embeddings, ["full" if e else "fast" for e in escalate]
 
 
 # Singleton instance
@@ -112,8 +380,31 @@ _ml_service_instance: Optional[SoilMLService] = None
 
 
 def get_ml_service() -> SoilMLService:
-    """Get singleton instance of ML service"""
+    """Get singleton instance of ML service (client of the inference server in remote mode)"""
     global _ml_service_instance
+    if not settings.ML_ENABLED:
+        raise HTTPException(status_code=503, detail="Soil analysis is not available on this server")
+    if settings.INFERENCE_MODE == "remote":
+        from app.services.inference_client import get_remote_ml_service
+        return get_remote_ml_service()
     if _ml_service_instance is None:
         _ml_service_instance = SoilMLService()
     return _ml_service_instance
+
+
+async def watch_model_manifest(interval: float):
+    """
+    Poll the registry manifest and hot-reload this worker when the active
+    version changes. Every uvicorn worker runs its own watcher, so activating
+    a version once rolls it out to all of them without a restart.
+    """
+    service = get_ml_service()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            active = service.registry.active_version()
+            # Ещё не загруженная модель подхватит активную версию сама
+            if service.current is not None and active != service.model_version:
+                await run_in_threadpool(service.reload, active)
+        except Exception as e:
+            print(f"Model reload failed: {e}")
@@ -0,0 +1,115 @@
+"""
+Versioned model registry
+
+Layout:
+    app/ml_model/
+        manifest.json                  {"active": "v2", "versions": {"v1": {...}, "v2": {...}}}
+        versions/<version>/model.keras
+        versions/<version>/class_mapping.json
+
+Without a manifest the legacy files (best_model.keras / soil_classifier.keras
+and class_mapping.json in the model root) are served as version "legacy".
+
+Register a new version:
+    python -m app.services.model_registry register v2 app/ml_model/best_model.keras app/ml_model/class_mapping.json
+Activate it (running workers pick it up via the admin endpoint / manifest watcher):
+    python -m app.services.model_registry activate v2
+"""
+import json
+import os
+import shutil
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+LEGACY_VERSION = "legacy"
+
+
+@dataclass(frozen=True)
+class ModelFiles:
+    version: str
+    model_file: Path
+    class_mapping_file: Path
+
+
+class ModelRegistry:
+    def __init__(self, root: Path):
+        self.root = root
+        self.manifest_path = root / "manifest.json"
+        self.versions_dir = root / "versions"
+
+    def read_manifest(self) -> dict:
+        if not self.manifest_path.exists():
+            return {"active": LEGACY_VERSION, "versions": {}}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict):
+        # Атомарная замена: читатели видят либо старый, либо новый манифест
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def active_version(self) -> str:
+        return self.read_manifest()["active"]
+
+    def resolve(self, version: str | None = None) -> ModelFiles:
+        """Files for the given version (active one by default)"""
+        version = version or self.active_version()
+
+        if version == LEGACY_VERSION:
+            model_file = self.root / "best_model.keras"
+            if not model_file.exists():
+                model_file = self.root / "soil_classifier.keras"
+            return ModelFiles(version, model_file, self.root / "class_mapping.json")
+
+        if version not in self.read_manifest()["versions"]:
+            raise ValueError(f"Unknown model version: {version}")
+
+        version_dir = self.versions_dir / version
+        return ModelFiles(version, version_dir / "model.keras", version_dir / "class_mapping.json")
+
+    def register(self, version: str, model_file: Path, class_mapping_file: Path, activate: bool = False):
+        """Copy model files into versions/<version> and add it to the manifest"""
+        if version == LEGACY_VERSION:
+            raise ValueError(f"'{LEGACY_VERSION}' is reserved")
+
+        version_dir = self.versions_dir / version
+        version_dir.mkdir(parents=True, exist_ok=False)
+        shutil.copy2(model_file, version_dir / "model.keras")
+        shutil.copy2(class_mapping_file, version_dir / "class_mapping.json")
+
+        manifest = self.read_manifest()
+        manifest["versions"][version] = {
+            "created_at": datetime.utcnow().isoformat(),
+            "source": str(model_file),
+        }
+        if activate:
+            manifest["active"] = version
+        self._write_manifest(manifest)
+
+    def activate(self, version: str):
+        if version != LEGACY_VERSION:
+            self.resolve(version)
+        manifest = self.read_manifest()
+        manifest["active"] = version
+        self._write_manifest(manifest)
+
+
+if __name__ == "__main__":
+    registry = ModelRegistry(Path("app/ml_model"))
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if command == "register" and len(sys.argv) == 5:
+        registry.register(sys.argv[2], Path(sys.argv[3]), Path(sys.argv[4]))
+        print(f"Registered {sys.argv[2]}")
+    elif command == "activate" and len(sys.argv) == 3:
+        registry.activate(sys.argv[2])
+        print(f"Active version: {sys.argv[2]}")
+    elif command == "list":
+        print(json.dumps(registry.read_manifest(), ensure_ascii=False, indent=2))
+    else:
+        print("Usage: python -m app.services.model_registry [list | register <version> <model.keras> <class_mapping.json> | activate <version>]")
+        sys.exit(1)
@@ -0,0 +1,197 @@
+"""
+Image preprocessing shared by the in-process model and the inference server client
+"""
+import os
+import struct
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO
+
+if TYPE_CHECKING:
+    import numpy as np
+
+IMG_HEIGHT = 224
+IMG_WIDTH = 224
+INPUT_SHAPE = (IMG_HEIGHT, IMG_WIDTH, 3)
+
+# Формат по сигнатуре -> расширение ключа в хранилище
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+# SOF0..SOF15 без DHT (C4), JPG (C8) и DAC (CC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+@dataclass(frozen=True)
+class ImageHeader:
+    format: str  # jpeg | png | webp
+    width: int
+    height: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def read_image_header(stream: BinaryIO) -> ImageHeader | None:
+    """
+    Format and dimensions from the magic bytes and the header, without decoding
+
+    Reads a few dozen bytes (JPEG: only the segment headers up to the frame
+    header, segment bodies are skipped with seek). None - not a JPEG/PNG/WebP
+    or a broken header. The stream is rewound to the start.
+    """
+    try:
+        head = stream.read(32)
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            # IHDR всегда первый чанк
+            if head[12:16] != b"IHDR":
+                return None
+            width, height = struct.unpack(">II", head[16:24])
+            header = ImageHeader("png", width, height)
+        elif head.startswith(b"\xff\xd8"):
+            header = _jpeg_header(stream)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            header = _webp_header(head)
+        else:
+            return None
+    except struct.error:
+        return None
+    finally:
+        stream.seek(0)
+
+    if header is None or header.width <= 0 or header.height <= 0:
+        return None
+    return header
+
+
+def _jpeg_header(stream: BinaryIO) -> ImageHeader | None:
+    stream.seek(2)
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        while code == 0xFF:  # заполняющие байты перед маркером
+            byte = stream.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue  # маркеры без длины
+        if code in (0xD9, 0xDA):
+            return None  # конец или данные скана раньше заголовка кадра
+
+        (length,) = struct.unpack(">H", stream.read(2))
+        if length < 2:
+            return None
+        if code in _JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", stream.read(5))
+            return ImageHeader("jpeg", width, height)
+        stream.seek(length - 2, os.SEEK_CUR)
+
+
+def _webp_header(head: bytes) -> ImageHeader | None:
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        # Холст: 24-битные little-endian (ширина - 1), (высота - 1)
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+    elif chunk == b"VP8 ":
+        if head[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", head[26:30])
+        width, height = width & 0x3FFF, height & 0x3FFF
+    elif chunk == b"VP8L":
+        if head[20:21] != b"\x2f":
+            return None
+        bits = int.from_bytes(head[21:25], "little")
+        width = (bits & 0x3FFF) + 1
+        height = ((bits >> 14) & 0x3FFF) + 1
+    else:
+        return None
+    return ImageHeader("webp", width, height)
+
+
+def load_image(image_path: str | BinaryIO) -> "np.ndarray":
+    """
+    Decode and resize an image to a (H, W, 3) uint8 array
+
+    Cheaper to pass between processes than the normalized float32 tensor.
+    """
+    import numpy as np
+    from PIL import Image
+
+    # Load image
+    img = Image.open(image_path)
+
+    # Convert to RGB if necessary
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # Resize
+    img = img.resize((IMG_WIDTH, IMG_HEIGHT))
+
+    return np.asarray(img)
+
+
+def normalize(images: "np.ndarray", out: "np.ndarray | None" = None) -> "np.ndarray":
+    """uint8 images (..., H, W, 3) -> float32 in [0, 1], optionally into `out`"""
+    import numpy as np
+
+    if out is None:
+        out = np.empty(images.shape, dtype=np.float32)
+    np.divide(images, 255.0, out=out, casting="unsafe")
+    return out
+
+
+def preprocess_image(image_path: str | BinaryIO, out: "np.ndarray | None" = None) -> "np.ndarray":
+    """
+    Load an image as a normalized float32 batch of one
+
+    Args:
+        image_path: Path to the image file or a binary file object
+        out: Optional (1, H, W, 3) float32 buffer to write into (e.g. shared memory)
+
+    Returns:
+        Preprocessed image array of shape (1, H, W, 3)
+    """
+    import numpy as np
+
+    if out is None:
+        out = np.empty((1, *INPUT_SHAPE), dtype=np.float32)
+
+    # Normalize straight into the target buffer
+    normalize(load_image(image_path), out=out[0])
+
+    return out
+
+
+HASH_SIZE = 8
+
+
+def image_dhash(source) -> int:
+    """
+    64-bit difference hash of an image (path or binary file object)
+
+    Robust to re-compression, resizing and small crops; compare hashes with
+    hamming_distance. Returned as a signed int64 so it fits a BIGINT column.
+    """
+    from PIL import Image
+
+    img = Image.open(source)
+    # JPEG: декодируем сразу в уменьшенном масштабе, полный размер не нужен
+    img.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))
+    pixels = list(img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two 64-bit hashes"""
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
@@ -0,0 +1,74 @@
+"""
+Redis-backed rate limiting (sliding window)
+
+Rules come from settings.RATE_LIMITS, keyed by "<route>:<identity>", e.g.
+"login:ip" -> "20/minute" or "resend-code:email" -> "1/minute,5/hour".
+Every rule is checked atomically with a Lua script on the shared Redis
+connection. When Redis is unavailable the limiter fails open and skips
+Redis entirely for RATE_LIMIT_FAIL_OPEN_SECONDS (RedisBreaker, shared with
+the dashboard cache), so an outage costs one timeout instead of one per request.
+"""
+import time
+import uuid
+from functools import lru_cache
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.services.redis_client import RedisBreaker, RedisClient
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rules(value: str) -> tuple[tuple[int, int], ...]:
+    """'5/minute,20/hour' -> ((5, 60), (20, 3600)); the period may also be seconds: '5/30'"""
+    rules = []
+    for part in value.split(","):
+        count, period = part.strip().split("/")
+        seconds = _PERIODS[period] if period in _PERIODS else int(period)
+        rules.append((int(count), seconds))
+    return tuple(rules)
+
+
+class RateLimiter:
+    def __init__(self, redis_client: RedisClient):
+        self.redis = redis_client
+
+    async def check(self, route: str, **identities: str | int | None):
+        """
+        Count a request against every configured rule for the route.
+
+        Raises 429 with Retry-After when any rule is exhausted.
+        Example: await limiter.check("login", ip=client_ip, email=creds.email)
+        """
+        if not settings.RATE_LIMIT_ENABLED or RedisBreaker.is_open():
+            return
+
+        for kind, identity in identities.items():
+            rule = settings.RATE_LIMITS.get(f"{route}:{kind}")
+            if not rule or identity is None:
+                continue
+
+            identity = str(identity).lower()
+            for limit, window in parse_rules(rule):
+                now_ms = int(time.time() * 1000)
+                try:
+                    allowed, _remaining, retry_after_ms = await self.redis.sliding_window_hit(
+                        key=f"ratelimit:{route}:{kind}:{window}:{identity}",
+                        limit=limit,
+                        window_ms=window * 1000,
+                        now_ms=now_ms,
+                        member=f"{now_ms}-{uuid.uuid4().hex[:8]}"
+                    )
+                except (RedisError, OSError):
+                    RedisBreaker.trip()
+                    return
+
+                if not allowed:
+                    raise HTTPException(
+                        status_code=429,
+                        detail="Слишком много запросов, попробуйте позже",
+                        headers={"Retry-After": str(max(1, -(-retry_after_ms // 1000)))}
+                    )
@@ -1,20 +1,85 @@
+import time
+
 import redis.asyncio as redis
 
 from app.core.config import settings
 
+# Sliding window log: ZSET с временными метками запросов в окне (атомарно)
+# KEYS[1] - ключ окна; ARGV: now_ms, window_ms, limit, member
+# Возвращает {allowed, remaining, retry_after_ms}
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
 
-class RedisClient:
-    def __init__(self):
-        self.redis = redis.Redis(
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, math.max(tonumber(oldest[2]) + window - now, 0)}
+"""
+
+# Один пул соединений на процесс
+_redis: redis.Redis | None = None
+_sliding_window_script = None
+
+
+def get_redis() -> redis.Redis:
+    global _redis, _sliding_window_script
+    if _redis is None:
+        _redis = redis.Redis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=settings.REDIS_DB,
             password=settings.REDIS_PASSWORD,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
             decode_responses=True
         )
+        # EVALSHA с автоматическим SCRIPT LOAD при NOSCRIPT
+        _sliding_window_script = _redis.register_script(SLIDING_WINDOW_LUA)
+    return _redis
+
+
+class RedisBreaker:
+    """
+    Process-wide fail-open switch for optional Redis features
+
+    After an error the rate limiter and the dashboard cache skip Redis for
+    RATE_LIMIT_FAIL_OPEN_SECONDS, so an outage costs one socket timeout
+    instead of one per request.
+    """
+    _open_until: float = 0.0
+
+    @classmethod
+    def is_open(cls) -> bool:
+        return time.monotonic() < cls._open_until
+
+    @classmethod
+    def trip(cls):
+        cls._open_until = time.monotonic() + settings.RATE_LIMIT_FAIL_OPEN_SECONDS
+
+
+class RedisClient:
+    def __init__(self):
+        self.redis = get_redis()
 
     async def save_verify_code(self, email: str, verify_code: str):
         await self.redis.set(f'verification:{email}', verify_code, ex=300)
 
     async def get_verify_code(self, email: str):
-        return await self.redis.get(f'verification:{email}')
\ No newline at end of file
+        return await self.redis.get(f'verification:{email}')
+
+    async def sliding_window_hit(self, key: str, limit: int, window_ms: int, now_ms: int, member: str) -> tuple[bool, int, int]:
+        """Register a hit in the window, return (allowed, remaining, retry_after_ms)"""
+        allowed, remaining, retry_after_ms = await _sliding_window_script(
+            keys=[key], args=[now_ms, window_ms, limit, member]
+        )
+        return bool(allowed), int(remaining), int(retry_after_ms)
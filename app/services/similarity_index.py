@@ -0,0 +1,260 @@
+"""
+In-memory nearest-neighbour search over CNN embeddings
+
+Embeddings are L2-normalized, so cosine similarity is a dot product and a
+search is one float32 matrix-vector multiply over the candidate rows:
+- scope "user": the rows of one user (usually a few hundred, sub-millisecond);
+- scope "global": every row, or, once the index reaches
+  SIMILARITY_IVF_MIN_SIZE, only the rows in the SIMILARITY_IVF_NPROBE
+  closest of SIMILARITY_IVF_LISTS k-means cells (IVF).
+
+Each worker process keeps its own index. It is built from the database on
+first use and then caught up incrementally (rows with id > last seen id)
+at most every SIMILARITY_REFRESH_SECONDS; analyses created or deleted by
+this worker are applied immediately. Decoding, the first build and the IVF
+cell assignment run in the threadpool, not on the event loop.
+"""
+import asyncio
+import time
+from typing import Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.repository.postgres import DatabaseRepo
+
+EMBEDDING_DTYPE = np.float16
+
+
+def encode_embedding(embedding: list[float]) -> bytes:
+    """Normalize and pack an embedding for storage (float16, 2 bytes per dim)"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.astype(EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE).astype(np.float32)
+
+
+def decode_embeddings(rows) -> np.ndarray:
+    """Embeddings of a batch of rows as one (n, dim) float32 matrix"""
+    packed = np.frombuffer(b"".join(row["embedding"] for row in rows), dtype=EMBEDDING_DTYPE)
+    return packed.reshape(len(rows), -1).astype(np.float32)
+
+
+class VectorIndex:
+    """Growable float32 matrix of unit vectors with optional IVF cells"""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.row_of: dict[int, int] = {}
+
+        self.centroids: Optional[np.ndarray] = None
+        self.cell_rows: list[list[int]] = []
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.vectors, self.ids, self.alive = vectors, ids, alive
+
+    def add(self, item_id: int, vector: np.ndarray) -> int:
+        """Insert or replace a vector, return its row"""
+        row = self.row_of.get(item_id)
+        is_new = row is None
+        if is_new:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.row_of[item_id] = row
+
+        self.vectors[row] = vector
+        self.ids[row] = item_id
+        self.alive[row] = True
+
+        if is_new and self.centroids is not None:
+            self.cell_rows[int(np.argmax(self.centroids @ vector))].append(row)
+        return row
+
+    def remove(self, item_id: int):
+        # Строка остаётся, но исключается из поиска
+        row = self.row_of.pop(item_id, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def get(self, item_id: int) -> Optional[np.ndarray]:
+        row = self.row_of.get(item_id)
+        return None if row is None else self.vectors[row]
+
+    def train_centroids(self, nlist: int, iterations: int = 10, sample_size: int = 20000, seed: int = 0) -> np.ndarray:
+        """Spherical k-means on a sample of live rows (safe to run in a thread)"""
+        rng = np.random.default_rng(seed)
+        live_rows = np.flatnonzero(self.alive[:self.size])
+        sample = self.vectors[rng.choice(live_rows, min(sample_size, len(live_rows)), replace=False)]
+        centroids = sample[rng.choice(len(sample), min(nlist, len(sample)), replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cell in range(len(centroids)):
+                members = sample[assignment == cell]
+                if len(members):
+                    center = members.sum(axis=0)
+                    centroids[cell] = center / (np.linalg.norm(center) or 1.0)
+        return centroids
+
+    def assign_cells(self, centroids: np.ndarray, size: int) -> list[list[int]]:
+        """Cell of every row below `size` (safe to run in a thread)"""
+        assignment = np.argmax(self.vectors[:size] @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(1, len(centroids)))
+        return [cell.tolist() for cell in np.split(order, bounds)]
+
+    def set_centroids(self, centroids: np.ndarray, cell_rows: list[list[int]], size: int):
+        """Switch to IVF search with cells from assign_cells; rows added since `size` are assigned here"""
+        for row in range(size, self.size):
+            cell_rows[int(np.argmax(centroids @ self.vectors[row]))].append(row)
+        self.cell_rows = cell_rows
+        self.centroids = centroids
+
+    def search(self, query: np.ndarray, k: int, rows: Optional[np.ndarray] = None, nprobe: int = 8) -> list[tuple[int, float]]:
+        """Top-k (id, cosine similarity) among `rows` (default: all, via IVF if trained)"""
+        if rows is None:
+            if self.centroids is not None:
+                cells = np.argsort(self.centroids @ query)[::-1][:nprobe]
+                rows = np.fromiter((r for c in cells for r in self.cell_rows[c]), dtype=np.int64)
+            else:
+                rows = np.arange(self.size)
+
+        rows = rows[self.alive[rows]]
+        if len(rows) == 0:
+            return []
+
+        scores = self.vectors[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top]
+
+
+class SimilarityIndexService:
+    """Process-wide embedding index with per-user row lists"""
+
+    def __init__(self):
+        self.index: Optional[VectorIndex] = None
+        self.user_rows: dict[int, list[int]] = {}
+        self.last_id = 0
+        self._synced_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.index is not None
+
+    def contains(self, analysis_id: int) -> bool:
+        return self.index is not None and analysis_id in self.index.row_of
+
+    def add(self, analysis_id: int, user_id: int, embedding: bytes):
+        if self.index is None:
+            self.index = VectorIndex(dim=len(embedding) // np.dtype(EMBEDDING_DTYPE).itemsize)
+        _add_rows(self.index, self.user_rows, [analysis_id], [user_id], decode_embedding(embedding)[None, :])
+
+    def remove(self, analysis_id: int):
+        if self.index is not None:
+            self.index.remove(analysis_id)
+
+    async def sync(self, repo: DatabaseRepo, force: bool = False):
+        """Load embeddings added since the last sync (all of them the first time)"""
+        if not force and self.loaded and time.monotonic() - self._synced_at < settings.SIMILARITY_REFRESH_SECONDS:
+            return
+
+        async with self._lock:
+            if self.index is None:
+                await self._build(repo)
+            else:
+                async for rows in repo.stream_soil_embeddings(after_id=self.last_id):
+                    vectors = await run_in_threadpool(decode_embeddings, rows)
+                    ids = [row["id"] for row in rows]
+                    _add_rows(self.index, self.user_rows, ids, [row["user_id"] for row in rows], vectors)
+                    # last_id двигает только синхронизация: строки других воркеров
+                    # с меньшими id не должны пропасть после локального add()
+                    self.last_id = max(self.last_id, rows[-1]["id"])
+            self._synced_at = time.monotonic()
+
+            index = self.index
+            if index is not None and index.centroids is None and len(index) >= settings.SIMILARITY_IVF_MIN_SIZE:
+                # k-means и назначение ячеек - в потоке; строки, добавленные тем временем, - при переключении
+                centroids = await run_in_threadpool(index.train_centroids, settings.SIMILARITY_IVF_LISTS)
+                size = index.size
+                cell_rows = await run_in_threadpool(index.assign_cells, centroids, size)
+                index.set_centroids(centroids, cell_rows, size)
+
+    async def _build(self, repo: DatabaseRepo):
+        """First load: decode and insert in a thread into a private index, then swap it in"""
+        index: Optional[VectorIndex] = None
+        user_rows: dict[int, list[int]] = {}
+        last_id = 0
+        async for rows in repo.stream_soil_embeddings(after_id=0):
+            index = await run_in_threadpool(_load_rows, index, user_rows, rows)
+            last_id = max(last_id, rows[-1]["id"])
+        # Пока индекс не загружен, add() из запросов не вызывается (строки придут из БД)
+        self.index, self.user_rows, self.last_id = index, user_rows, last_id
+
+    def search(self, analysis_id: int, k: int, user_id: Optional[int] = None) -> list[tuple[int, float]]:
+        """Neighbours of a stored analysis, excluding itself; user_id restricts to that user's rows"""
+        if self.index is None:
+            return []
+        query = self.index.get(analysis_id)
+        if query is None:
+            return []
+
+        rows = None
+        if user_id is not None:
+            rows = np.asarray(self.user_rows.get(user_id, []), dtype=np.int64)
+
+        hits = self.index.search(query, k + 1, rows=rows, nprobe=settings.SIMILARITY_IVF_NPROBE)
+        return [(hit_id, score) for hit_id, score in hits if hit_id != analysis_id][:k]
+
+
+def _add_rows(index: VectorIndex, user_rows: dict[int, list[int]], ids: list[int], user_ids: list[int], vectors: np.ndarray):
+    for analysis_id, user_id, vector in zip(ids, user_ids, vectors):
+        is_new = analysis_id not in index.row_of
+        row = index.add(analysis_id, vector)
+        if is_new:
+            user_rows.setdefault(user_id, []).append(row)
+
+
+def _load_rows(index: Optional[VectorIndex], user_rows: dict[int, list[int]], rows) -> VectorIndex:
+    """Insert a batch of database rows into an index not yet visible to requests (runs in a thread)"""
+    vectors = decode_embeddings(rows)
+    if index is None:
+        index = VectorIndex(dim=vectors.shape[1], capacity=max(1024, len(rows)))
+    _add_rows(index, user_rows, [row["id"] for row in rows], [row["user_id"] for row in rows], vectors)
+    return index
+
+
+# Singleton instance
+_similarity_index: Optional[SimilarityIndexService] = None
+
+
+def get_similarity_index() -> SimilarityIndexService:
+    """Get singleton instance of similarity index"""
+    global _similarity_index
+    if _similarity_index is None:
+        _similarity_index = SimilarityIndexService()
+    return _similarity_index
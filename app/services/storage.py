@@ -0,0 +1,310 @@
+"""
+Upload storage
+
+Uploads are content-addressed: the key of an image is derived from the
+SHA-256 of its bytes and sharded two levels deep,
+
+    uploads/3f/a9/3fa9...e1.jpg
+
+so identical uploads share one object and no directory grows past a few
+thousand entries. The key is what `SoilAnalysis.image_path` stores (keys
+written before this layer, `uploads/<uuid>.jpg`, keep working).
+
+Backends:
+    local   - files under STORAGE_LOCAL_ROOT (writes are atomic: temp file + rename)
+    memory  - flat in-process key/value store with S3 semantics, a stand-in
+              for an object store in local runs and tests
+
+Objects are never deleted if another analysis may still point at them;
+images of deleted analyses are released by a background task after the
+response (release_images). Anything left behind by a crash between the write
+and the database commit is removed by collect_garbage, which reconciles
+stored keys against soil_analyses.image_path in bulk:
+
+    python -m app.services.storage gc [--dry-run]
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+UPLOAD_PREFIX = "uploads"
+
+
+def content_key(data: bytes, ext: str) -> str:
+    """Storage key of an upload: sharded SHA-256 of its content"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{UPLOAD_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+class StorageBackend(ABC):
+    """Minimal object store interface (blocking; call from a threadpool)"""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Store an object; storing an existing content-addressed key is a no-op"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Binary file object with the object's content (FileNotFoundError if missing)"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an object; missing objects are ignored"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def touch(self, key: str) -> bool:
+        """Refresh the object's modified time; False if it is missing"""
+
+    @abstractmethod
+    def modified(self, key: str) -> Optional[float]:
+        """Last write or put() of the object, unix time (None if missing)"""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        """(key, modified unix time) of every object under the prefix"""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Filesystem path of the object, if the backend has one (for sendfile)"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if path.exists():
+            # Свежий mtime: GC не удалит сироту, которую этот запрос сейчас начнёт использовать
+            os.utime(path)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Во временный файл рядом и атомарный rename: читатели не видят недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def touch(self, key: str) -> bool:
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def modified(self, key: str) -> Optional[float]:
+        try:
+            return self._path(key).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        base = self._path(prefix)
+        if not base.is_dir():
+            return
+        root = self.root.resolve()
+        for dirpath, _dirnames, filenames in os.walk(base):
+            for filename in filenames:
+                # .tmp-* - незавершённые записи, прочие скрытые файлы (.gitkeep) не наши
+                if filename.startswith("."):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    modified = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                yield path.relative_to(root).as_posix(), modified
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+
+class MemoryStorage(StorageBackend):
+    """Object-store stand-in: flat keys, no directories, whole-object reads"""
+
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, float]] = {}
+
+    def put(self, key: str, data: bytes) -> None:
+        self.objects[key] = (self.objects[key][0] if key in self.objects else bytes(data), time.time())
+
+    def open(self, key: str) -> BinaryIO:
+        if key not in self.objects:
+            raise FileNotFoundError(key)
+        return io.BytesIO(self.objects[key][0])
+
+    def delete(self, key: str) -> None:
+        self.objects.pop(key, None)
+
+    def exists(self, key: str) -> bool:
+        return key in self.objects
+
+    def touch(self, key: str) -> bool:
+        if key not in self.objects:
+            return False
+        self.objects[key] = (self.objects[key][0], time.time())
+        return True
+
+    def modified(self, key: str) -> Optional[float]:
+        entry = self.objects.get(key)
+        return entry[1] if entry is not None else None
+
+    def list(self, prefix: str) -> Iterator[tuple[str, float]]:
+        prefix = prefix.rstrip("/") + "/"
+        for key, (_data, modified) in list(self.objects.items()):
+            if key.startswith(prefix):
+                yield key, modified
+
+
+def _delete_if_stale(storage: StorageBackend, keys: list[str], cutoff: float) -> int:
+    """Delete objects not written or put() since cutoff; the mtime is checked right before each delete"""
+    deleted = 0
+    for key in keys:
+        modified = storage.modified(key)
+        if modified is not None and modified < cutoff:
+            storage.delete(key)
+            deleted += 1
+    return deleted
+
+
+async def collect_garbage(storage: StorageBackend, repo, grace_seconds: float, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    Delete stored uploads that no analysis references
+
+    Objects younger than grace_seconds are skipped: they may belong to a
+    request that has written the file but not yet committed its analysis.
+    References are checked with one query per batch of keys, and the mtime
+    again right before each delete (an upload of the same content may have
+    put() the key after the reference check).
+    """
+    cutoff = time.time() - grace_seconds
+    keys = await run_in_threadpool(
+        lambda: [key for key, modified in storage.list(UPLOAD_PREFIX) if modified < cutoff]
+    )
+
+    orphans = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        referenced = await repo.get_referenced_image_paths(batch)
+        orphans += [key for key in batch if key not in referenced]
+
+    deleted = 0
+    if not dry_run:
+        for start in range(0, len(orphans), batch_size):
+            deleted += await run_in_threadpool(_delete_if_stale, storage, orphans[start:start + batch_size], cutoff)
+
+    return {"checked": len(keys), "orphans": len(orphans), "deleted": deleted}
+
+
+async def release_images(image_keys: list[str], batch_size: int = 1000):
+    """
+    Delete images of deleted analyses that no other analysis points at
+
+    Runs as a background task after the response: its own session, batched
+    reference checks, unlinks in the threadpool. As in collect_garbage, files
+    touched within STORAGE_GC_GRACE_SECONDS are kept: an upload of the same
+    content (or a reused duplicate) may have put() the key and not committed
+    its analysis yet. Those and any failures are left to the GC.
+    """
+    from app.db.session import AsyncSessionLocal
+    from app.repository.postgres import DatabaseRepo
+
+    storage = get_storage()
+    keys = list(dict.fromkeys(image_keys))
+    try:
+        async with AsyncSessionLocal() as session:
+            repo = DatabaseRepo(session)
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                referenced = await repo.get_referenced_image_paths(batch)
+                orphans = [key for key in batch if key not in referenced]
+                cutoff = time.time() - settings.STORAGE_GC_GRACE_SECONDS
+                await run_in_threadpool(_delete_if_stale, storage, orphans, cutoff)
+    except Exception as e:
+        print(f"Failed to delete {len(keys)} images, left for storage GC: {e}")
+
+
+async def run_storage_gc(interval: float):
+    """Periodic garbage collection of unreferenced uploads (one task per worker)"""
+    from app.db.session import AsyncSessionLocal
+    from app.repository.postgres import DatabaseRepo
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await collect_garbage(get_storage(), DatabaseRepo(session), settings.STORAGE_GC_GRACE_SECONDS)
+            if result["deleted"]:
+                print(f"Storage GC: deleted {result['deleted']} of {result['checked']} uploads")
+        except Exception as e:
+            print(f"Storage GC failed: {e}")
+
+
+# Singleton instance
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Get singleton instance of the configured storage backend"""
+    global _storage
+    if _storage is None:
+        if settings.STORAGE_BACKEND == "memory":
+            _storage = MemoryStorage()
+        else:
+            _storage = LocalStorage(Path(settings.STORAGE_LOCAL_ROOT))
+    return _storage
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if command == "gc":
+        from app.db.session import AsyncSessionLocal
+        from app.repository.postgres import DatabaseRepo
+
+        async def main():
+            async with AsyncSessionLocal() as session:
+                return await collect_garbage(
+                    get_storage(), DatabaseRepo(session), settings.STORAGE_GC_GRACE_SECONDS,
+                    dry_run="--dry-run" in sys.argv
+                )
+
+        print(asyncio.run(main()))
+    else:
+        print("Usage: python -m app.services.storage gc [--dry-run]")
+        sys.exit(1)
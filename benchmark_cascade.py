@@ -0,0 +1,122 @@
+"""
+Report: confidence-gated model cascade on the test split
+
+    python benchmark_cascade.py --fast-version student-v1
+    python benchmark_cascade.py --fast-version student-v1 --thresholds 0.7 0.8 0.9 0.95 --output cascade.json
+
+Runs every image of Dataset/test/<class>/ through both the fast model (a
+registered version) and the active full model, one image per call as in
+serving, and then replays the cascade for each threshold:
+
+    escalation   share of images below the threshold (sent to the full model)
+    accuracy     cascade accuracy and its delta to the full model alone
+    latency      mean fast + (escalated ? full : 0) per image, and the time
+                 saved against the full model alone
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import preprocessing
+from app.services.ml_service import SoilMLService
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def iter_test_images(root: Path, class_names: list[str], limit: int | None):
+    for label, class_name in enumerate(class_names):
+        paths = sorted(p for p in (root / class_name).glob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+        for path in paths[:limit]:
+            yield path, label
+
+
+def timed(fn, batch: np.ndarray) -> tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    probabilities = np.asarray(fn(batch))[0]
+    return probabilities, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalation rate, accuracy and latency of the model cascade")
+    parser.add_argument("--fast-version", required=True, help="registered version of the fast model")
+    parser.add_argument("--test-dir", type=Path, default=Path("Dataset/test"))
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.8, 0.9, 0.95])
+    parser.add_argument("--limit", type=int, default=None, help="images per class")
+    parser.add_argument("--output", type=Path, default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    settings.CASCADE_FAST_VERSION = args.fast_version
+    service = SoilMLService()
+    service.load_model()
+    full, fast = service.current, service.fast
+    if fast is None:
+        raise SystemExit(f"Fast model {args.fast_version} could not be used (see above)")
+
+    class_names = full.class_mapping["class_names"]
+    labels, fast_probs, full_probs, fast_ms, full_ms = [], [], [], [], []
+    for path, label in iter_test_images(args.test_dir, class_names, args.limit):
+        batch = preprocessing.preprocess_image(str(path))
+        probabilities, elapsed = timed(fast.run, batch)
+        fast_probs.append(probabilities)
+        fast_ms.append(elapsed)
+        probabilities, elapsed = timed(full.run, batch)
+        full_probs.append(probabilities)
+        full_ms.append(elapsed)
+        labels.append(label)
+
+    if not labels:
+        raise SystemExit(f"No images found in {args.test_dir}")
+
+    labels = np.array(labels)
+    fast_probs, full_probs = np.array(fast_probs), np.array(full_probs)
+    fast_ms, full_ms = np.array(fast_ms), np.array(full_ms)
+    full_correct = full_probs.argmax(axis=1) == labels
+    fast_correct = fast_probs.argmax(axis=1) == labels
+
+    print("=" * 72)
+    print("MODEL CASCADE REPORT")
+    print("=" * 72)
+    print(f"Images: {len(labels)}  full: {full.version}  fast: {fast.version}")
+    print(f"Full model: accuracy {full_correct.mean() * 100:.2f}%, {full_ms.mean():.2f} ms/image")
+    print(f"Fast model: accuracy {fast_correct.mean() * 100:.2f}%, {fast_ms.mean():.2f} ms/image\n")
+    print(f"{'threshold':>10}{'escalated':>11}{'accuracy':>10}{'delta':>9}{'ms/image':>10}{'saved ms':>10}{'saved':>8}")
+
+    report = {
+        "images": int(len(labels)),
+        "full_version": full.version,
+        "fast_version": fast.version,
+        "full": {"accuracy": float(full_correct.mean()), "mean_ms": float(full_ms.mean())},
+        "fast": {"accuracy": float(fast_correct.mean()), "mean_ms": float(fast_ms.mean())},
+        "thresholds": [],
+    }
+    for threshold in args.thresholds:
+        escalate = fast_probs.max(axis=1) < threshold
+        correct = np.where(escalate, full_correct, fast_correct)
+        latency = fast_ms + escalate * full_ms
+        saved = full_ms.mean() - latency.mean()
+        delta = (correct.mean() - full_correct.mean()) * 100
+        print(
+            f"{threshold:>10.2f}{escalate.mean() * 100:>10.1f}%{correct.mean() * 100:>9.2f}%"
+            f"{delta:>+8.2f}%{latency.mean():>10.2f}{saved:>10.2f}{saved / full_ms.mean() * 100:>7.1f}%"
+        )
+        report["thresholds"].append({
+            "threshold": threshold,
+            "escalation_rate": float(escalate.mean()),
+            "accuracy": float(correct.mean()),
+            "accuracy_delta": float(correct.mean() - full_correct.mean()),
+            "mean_ms": float(latency.mean()),
+            "saved_ms": float(saved),
+        })
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: model.predict vs compiled tf.function inference
+
+    python benchmark_inference.py
+    python benchmark_inference.py --iterations 500 --batch-sizes 1 8 --xla
+    TF_INTRA_OP_THREADS=2 TF_INTER_OP_THREADS=1 python benchmark_inference.py
+
+Loads the active model through SoilMLService (so TF_* settings apply the same
+way as in serving) and reports latency percentiles and throughput per path.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.ml_service import SoilMLService, build_inference_fn
+
+
+def measure(fn, batch: np.ndarray, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn(batch)
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(batch)
+        timings.append(time.perf_counter() - started)
+
+    timings_ms = np.array(timings) * 1000
+    return {
+        "p50": float(np.percentile(timings_ms, 50)),
+        "p95": float(np.percentile(timings_ms, 95)),
+        "mean": float(timings_ms.mean()),
+        "images_per_sec": batch.shape[0] * iterations / float(np.sum(timings)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model.predict with compiled inference")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--xla", action="store_true", help="also benchmark jit_compile=True")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("INFERENCE BENCHMARK")
+    print("=" * 60)
+
+    service = SoilMLService()
+    service.load_model()
+    model = service.model
+    print(f"Model version: {service.model_version}\n")
+
+    paths = {
+        "model.predict": lambda x: model.predict(x, verbose=0),
+        "tf.function": build_inference_fn(model, service.img_height, service.img_width),
+    }
+    if args.xla:
+        paths["tf.function+xla"] = build_inference_fn(model, service.img_height, service.img_width, jit_compile=True)
+
+    rng = np.random.default_rng(0)
+    print(f"{'path':<18}{'batch':>6}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'img/s':>10}")
+    for batch_size in args.batch_sizes:
+        batch = rng.random((batch_size, service.img_height, service.img_width, 3), dtype=np.float32)
+        baseline = None
+        for name, fn in paths.items():
+            result = measure(fn, batch, args.iterations, args.warmup)
+            baseline = baseline or result["mean"]
+            print(
+                f"{name:<18}{batch_size:>6}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+                f"{result['mean']:>10.2f}{result['images_per_sec']:>10.1f}"
+                f"   x{baseline / result['mean']:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
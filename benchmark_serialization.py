@@ -0,0 +1,147 @@
+"""
+Benchmark: building and encoding history pages
+
+    python benchmark_serialization.py
+    python benchmark_serialization.py --rows 10 50 500 --iterations 300
+
+Fills an in-memory SQLite database with SoilAnalysis rows and calls a
+throwaway FastAPI app directly over ASGI (no network), so the numbers cover
+fetching a page, validation and JSON encoding:
+
+    response_model  ORM objects, per-row model_validate, FastAPI response_model
+                    validation and serialization (the old /history path)
+    orjson          ORM objects, per-row model_validate, orjson.dumps
+                    (what ORJSONResponse alone would give)
+    typeadapter     column rows, one TypeAdapter pass for the page,
+                    orjson bytes in a plain Response (current /history path)
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import Response
+from sqlalchemy import create_engine, desc, select
+from sqlalchemy.orm import Session
+
+from app.db.models import SoilAnalysis, User
+from app.db.session import Base
+from app.schemas.soil import SoilAnalysisResponse, SoilAnalysisListResponse, dump_analyses
+
+TEXT = "Плодородная почва с высоким содержанием гумуса, хорошо удерживает влагу. " * 4
+
+# Те же колонки, что и в DatabaseRepo.get_user_soil_analysis_rows
+PAGE_COLUMNS = [
+    SoilAnalysis.id, SoilAnalysis.image_filename, SoilAnalysis.image_path, SoilAnalysis.original_image_path,
+    SoilAnalysis.soil_type, SoilAnalysis.confidence, SoilAnalysis.description, SoilAnalysis.characteristics,
+    SoilAnalysis.recommended_crops, SoilAnalysis.recommendations, SoilAnalysis.model_version,
+    SoilAnalysis.cascade_stage, SoilAnalysis.duplicate_of, SoilAnalysis.created_at
+]
+
+
+def make_rows(count: int) -> list[SoilAnalysis]:
+    started = datetime(2024, 1, 1)
+    return [
+        SoilAnalysis(
+            id=i + 1, user_id=1, image_filename=f"photo_{i}.jpg",
+            image_path=f"uploads/ab/cd/{i:064x}.jpg", soil_type="Black Soil", confidence=0.87,
+            description=TEXT, characteristics=TEXT, recommended_crops="Пшеница, подсолнечник, кукуруза",
+            recommendations=TEXT, model_version="v2", created_at=started + timedelta(minutes=i)
+        )
+        for i in range(count)
+    ]
+
+
+def make_database(count: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(id=1, username="bench", email="bench@example.com", hashed_password="-"))
+        session.add_all(make_rows(count))
+        session.commit()
+    return engine
+
+
+def build_app(engine, count: int) -> FastAPI:
+    app = FastAPI()
+
+    def orm_page():
+        with Session(engine) as session:
+            return session.execute(
+                select(SoilAnalysis).order_by(desc(SoilAnalysis.created_at)).limit(count)
+            ).scalars().all()
+
+    @app.get("/response_model", response_model=SoilAnalysisListResponse)
+    async def response_model():
+        return SoilAnalysisListResponse(
+            analyses=[SoilAnalysisResponse.model_validate(a) for a in orm_page()],
+            total=count
+        )
+
+    @app.get("/orjson")
+    async def orjson_path():
+        analyses = [SoilAnalysisResponse.model_validate(a).model_dump(mode="json") for a in orm_page()]
+        return Response(orjson.dumps({"analyses": analyses, "total": count}), media_type="application/json")
+
+    @app.get("/typeadapter")
+    async def typeadapter():
+        with Session(engine) as session:
+            rows = session.execute(
+                select(*PAGE_COLUMNS).order_by(desc(SoilAnalysis.created_at)).limit(count)
+            ).mappings().all()
+        return Response(orjson.dumps({"analyses": dump_analyses(rows), "total": count}), media_type="application/json")
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    """One GET through the ASGI interface, returns the body"""
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+    }
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def measure(app: FastAPI, path: str, iterations: int) -> tuple[float, int]:
+    size = len(await call(app, path))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call(app, path)
+    return (time.perf_counter() - started) / iterations * 1000, size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare JSON encoding paths for history pages")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 50, 500])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("HISTORY SERIALIZATION BENCHMARK")
+    print("=" * 60)
+    print(f"{'path':<16}{'rows':>6}{'ms/page':>10}{'bytes':>10}")
+    for count in args.rows:
+        app = build_app(make_database(count), count)
+        baseline = None
+        for path in ("response_model", "orjson", "typeadapter"):
+            elapsed, size = await measure(app, f"/{path}", args.iterations)
+            baseline = baseline or elapsed
+            print(f"{path:<16}{count:>6}{elapsed:>10.3f}{size:>10}   x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
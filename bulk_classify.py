@@ -0,0 +1,200 @@
+"""
+Offline bulk soil classification
+
+    python bulk_classify.py photos/ -o results.jsonl
+    python bulk_classify.py --manifest archive.txt -o results.csv --workers 8 --batch-size 64
+    python bulk_classify.py photos/ -o results.jsonl --resume
+
+Images are decoded and resized in a process pool, classified in batches by
+SoilMLService (same preprocessing and model as the API) and streamed to
+JSONL or CSV as they finish. With --resume, paths already present in the
+output file are skipped and new rows are appended.
+
+A manifest is a text file with one image path per line, or a CSV with a
+`path` column.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.services import preprocessing
+from app.services.ml_service import SoilMLService
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+FIELDS = ["path", "soil_type", "confidence", "model_version", "error"]
+
+
+def iter_directory(root: Path):
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield str(path)
+
+
+def iter_manifest(manifest: Path):
+    with open(manifest, "r", encoding="utf-8", newline="") as f:
+        if manifest.suffix.lower() == ".csv":
+            for row in csv.DictReader(f):
+                yield row["path"]
+        else:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+def load_done(output: Path, fmt: str) -> set[str]:
+    """Paths already written to the output file (for --resume)"""
+    if not output.exists():
+        return set()
+
+    with open(output, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            return {row["path"] for row in csv.DictReader(f)}
+        done = set()
+        for line in f:
+            try:
+                done.add(json.loads(line)["path"])
+            except (ValueError, KeyError):
+                # Оборванная последняя строка после падения
+                continue
+        return done
+
+
+def decode(path: str):
+    """Runs in a worker process: (path, uint8 image | None, error | None)"""
+    try:
+        return path, preprocessing.load_image(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class ResultWriter:
+    def __init__(self, output: Path, fmt: str, append: bool):
+        new_file = not (append and output.exists())
+        self.file = open(output, "a" if append else "w", encoding="utf-8", newline="")
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, row: dict):
+        if self.fmt == "csv":
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a directory or manifest of soil photos")
+    parser.add_argument("directory", nargs="?", type=Path, help="directory to walk recursively")
+    parser.add_argument("--manifest", type=Path, help="file with image paths (txt or csv with 'path')")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="results .jsonl or .csv")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default: by output extension")
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--resume", action="store_true", help="skip paths already in the output")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    if (args.directory is None) == (args.manifest is None):
+        parser.error("pass either a directory or --manifest")
+
+    fmt = args.format or ("csv" if args.output.suffix.lower() == ".csv" else "jsonl")
+
+    paths = list(iter_directory(args.directory) if args.directory else iter_manifest(args.manifest))
+    if args.resume:
+        done = load_done(args.output, fmt)
+        paths = [p for p in paths if p not in done]
+        print(f"Resume: {len(done)} already classified", file=sys.stderr)
+
+    total = len(paths)
+    print(f"Images to classify: {total}", file=sys.stderr)
+    if total == 0:
+        return
+
+    service = SoilMLService()
+    service.load_model()
+    print(f"Model version: {service.model_version}", file=sys.stderr)
+
+    writer = ResultWriter(args.output, fmt, append=args.resume)
+    batch_paths: list[str] = []
+    batch_images: list[np.ndarray] = []
+    processed = 0
+    errors = 0
+    started = time.perf_counter()
+
+    def flush_batch():
+        nonlocal processed
+        if not batch_images:
+            return
+        batch = preprocessing.normalize(np.stack(batch_images))
+        for path, prediction in zip(batch_paths, service.predict_batch(batch)):
+            writer.write({
+                "path": path,
+                "soil_type": prediction.soil_type,
+                "confidence": round(prediction.confidence, 6),
+                "model_version": prediction.model_version,
+                "error": None,
+            })
+        processed += len(batch_images)
+        batch_paths.clear()
+        batch_images.clear()
+        writer.flush()
+
+    def report(final: bool = False):
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0.0
+        eta = (total - processed) / rate if rate else 0.0
+        label = "Done" if final else "Progress"
+        print(
+            f"{label}: {processed}/{total} ({processed / total:.1%}), errors {errors}, "
+            f"{rate:.1f} img/s, elapsed {elapsed:.0f}s, eta {eta:.0f}s",
+            file=sys.stderr
+        )
+
+    # Окно задач ограничивает число декодированных, но ещё не классифицированных изображений
+    window = args.batch_size * 8
+    last_report = started
+    try:
+        # spawn: не форкаем процесс с уже запущенными потоками TensorFlow
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            for start in range(0, total, window):
+                for path, image, error in pool.map(decode, paths[start:start + window], chunksize=4):
+                    if error is not None:
+                        writer.write({"path": path, "soil_type": None, "confidence": None,
+                                      "model_version": None, "error": error})
+                        errors += 1
+                        processed += 1
+                        continue
+
+                    batch_paths.append(path)
+                    batch_images.append(image)
+                    if len(batch_images) >= args.batch_size:
+                        flush_batch()
+
+                if time.perf_counter() - last_report >= args.progress_interval:
+                    report()
+                    last_report = time.perf_counter()
+            flush_batch()
+    finally:
+        writer.close()
+
+    report(final=True)
+
+
+if __name__ == "__main__":
+    main()
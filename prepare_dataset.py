@@ -0,0 +1,201 @@
+"""
+One-time preprocessing of Dataset/ into memory-mapped NumPy shards
+
+    python prepare_dataset.py                       # Dataset/ -> Dataset_shards/
+    python prepare_dataset.py --dataset Dataset --output Dataset_shards --shard-size 2048
+    python train_model.py --shards Dataset_shards
+
+Layout:
+    Dataset_shards/<split>/index.json          class names, shard list, image size
+    Dataset_shards/<split>/images_00000.npy    uint8 (N, 224, 224, 3)
+    Dataset_shards/<split>/labels_00000.npy    int16 (N,)
+
+Images are decoded and resized once with the serving preprocessing
+(app.services.preprocessing.load_image). Readers open the shards with
+mmap_mode="r", so repeated runs stream batches from the page cache instead
+of re-decoding JPEGs, and sequential batches are zero-copy views.
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.services import preprocessing
+
+DATASET_PATH = Path("Dataset")
+SHARDS_PATH = Path("Dataset_shards")
+SPLITS = ("Train", "test")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def list_split(split_dir: Path, class_names: list[str]) -> list[tuple[str, int]]:
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = split_dir / class_name
+        if not class_dir.is_dir():
+            continue
+        for path in sorted(class_dir.iterdir()):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                samples.append((str(path), label))
+    return samples
+
+
+def _decode(path: str):
+    try:
+        return preprocessing.load_image(path)
+    except Exception:
+        return None
+
+
+def build_split(split_dir: Path, output_dir: Path, class_names: list[str], shard_size: int, workers: int | None):
+    samples = list_split(split_dir, class_names)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    skipped = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for start in range(0, len(samples), shard_size):
+            chunk = samples[start:start + shard_size]
+            decoded = list(pool.map(_decode, [path for path, _ in chunk], chunksize=8))
+            valid = [(image, label) for image, (path, label) in zip(decoded, chunk) if image is not None]
+            skipped += [path for image, (path, _) in zip(decoded, chunk) if image is None]
+
+            shard_id = len(shards)
+            images_name = f"images_{shard_id:05d}.npy"
+            labels_name = f"labels_{shard_id:05d}.npy"
+
+            # open_memmap пишет прямо в файл, в памяти только текущий шард
+            images = np.lib.format.open_memmap(
+                output_dir / images_name, mode="w+", dtype=np.uint8,
+                shape=(len(valid), *preprocessing.INPUT_SHAPE)
+            )
+            for i, (image, _) in enumerate(valid):
+                images[i] = image
+            images.flush()
+            del images
+
+            np.save(output_dir / labels_name, np.array([label for _, label in valid], dtype=np.int16))
+            shards.append({"images": images_name, "labels": labels_name, "count": len(valid)})
+            print(f"  {split_dir.name}: shard {shard_id} ({len(valid)} images)")
+
+    index = {
+        "class_names": class_names,
+        "image_shape": list(preprocessing.INPUT_SHAPE),
+        "count": sum(shard["count"] for shard in shards),
+        "shards": shards,
+        "skipped": skipped,
+    }
+    with open(output_dir / "index.json", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    return index
+
+
+class ShardedSplit:
+    """Read-only view over the shards of one split"""
+
+    def __init__(self, split_dir: Path):
+        with open(split_dir / "index.json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.class_names: list[str] = index["class_names"]
+        self.images = [np.load(split_dir / shard["images"], mmap_mode="r") for shard in index["shards"]]
+        # Метки маленькие - держим в памяти целиком
+        self.labels = np.concatenate(
+            [np.load(split_dir / shard["labels"]) for shard in index["shards"]]
+        ).astype(np.int32) if index["shards"] else np.zeros(0, dtype=np.int32)
+        self.offsets = np.cumsum([0] + [len(images) for images in self.images])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def batches(self, batch_size: int, shuffle: bool = False, seed: int | None = None):
+        """
+        Yield (uint8 images, int32 labels) batches.
+
+        Without shuffle batches are slices of the memory map (no copy; a
+        shard's last batch may be short). With shuffle each batch gathers
+        its rows from the shards, sorted per shard for locality.
+        """
+        if not shuffle:
+            for shard_id, images in enumerate(self.images):
+                base = self.offsets[shard_id]
+                for start in range(0, len(images), batch_size):
+                    stop = min(start + batch_size, len(images))
+                    yield images[start:stop], self.labels[base + start:base + stop]
+            return
+
+        order = np.random.default_rng(seed).permutation(len(self))
+        for start in range(0, len(order), batch_size):
+            indices = np.sort(order[start:start + batch_size])
+            shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+            batch = np.concatenate([
+                self.images[shard_id][indices[shard_ids == shard_id] - self.offsets[shard_id]]
+                for shard_id in np.unique(shard_ids)
+            ])
+            yield batch, self.labels[indices]
+
+    def to_tf_dataset(self, batch_size: int, shuffle: bool = False, augment=None, seed: int | None = None):
+        """tf.data pipeline: normalized float32 images and one-hot labels"""
+        import tensorflow as tf
+
+        num_classes = len(self.class_names)
+        epoch = {"n": 0}
+
+        def generator():
+            # Новая перестановка на каждую эпоху
+            epoch["n"] += 1
+            yield from self.batches(batch_size, shuffle, None if seed is None else seed + epoch["n"])
+
+        dataset = tf.data.Dataset.from_generator(
+            generator,
+            output_signature=(
+                tf.TensorSpec(shape=(None, *preprocessing.INPUT_SHAPE), dtype=tf.uint8),
+                tf.TensorSpec(shape=(None,), dtype=tf.int32),
+            )
+        )
+
+        def prepare(images, labels):
+            images = tf.cast(images, tf.float32) / 255.0
+            if augment is not None:
+                images = augment(images, training=True)
+            return images, tf.one_hot(labels, num_classes)
+
+        return dataset.map(prepare, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode Dataset/ once into memory-mapped .npy shards")
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--output", type=Path, default=SHARDS_PATH)
+    parser.add_argument("--shard-size", type=int, default=2048)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("DATASET PREPROCESSING")
+    print("=" * 50)
+
+    # Тот же порядок классов, что и у flow_from_directory
+    class_names = sorted(p.name for p in (args.dataset / SPLITS[0]).iterdir() if p.is_dir())
+    print(f"\nClasses: {class_names}")
+
+    for split in SPLITS:
+        split_dir = args.dataset / split
+        if not split_dir.exists():
+            continue
+        started = time.perf_counter()
+        index = build_split(split_dir, args.output / split, class_names, args.shard_size, args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"{split}: {index['count']} images in {len(index['shards'])} shards, "
+              f"{len(index['skipped'])} skipped, {elapsed:.1f}s")
+
+    print(f"\nShards saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Memory soak test for the serving path
+
+    python soak_test.py --iterations 5000
+    python soak_test.py --target route --iterations 3000 --max-growth-mb 50 --output soak.json
+    python soak_test.py --clear-session-mb 1500      # exercise the in-place mitigation
+
+Drives thousands of predictions through SoilMLService.predict (target
+"service") or through the /soil/analyze route in-process (target "route":
+the real endpoint with multipart parsing, validation, storage and
+inference; auth, rate limiting and the database are replaced by in-memory
+stand-ins, duplicate detection and the similarity index are off so that
+nothing grows by design).
+
+Every --sample-every iterations the RSS and the tracemalloc total are
+recorded. After the run the top Python allocators by growth since the end of
+warm-up are printed (tracemalloc sees NumPy and PIL buffers, not TensorFlow's
+C++ allocations - those show up only in RSS). Exit code 1 if RSS grew by
+more than --max-growth-mb after warm-up.
+"""
+import argparse
+import io
+import itertools
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.core.memory import rss_mb
+
+
+def synthetic_jpeg(width: int = 1280, height: int = 960) -> bytes:
+    """Camera-sized noisy JPEG, so decode and resize do real work"""
+    rng = np.random.default_rng(0)
+    pixels = (rng.random((height, width, 3)) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def service_driver(image: bytes, clear_session_mb: float | None):
+    from app.services.ml_service import SoilMLService
+
+    service = SoilMLService()
+    service.load_model()
+
+    def step():
+        service.predict(io.BytesIO(image))
+        if clear_session_mb and rss_mb() > clear_session_mb:
+            service.clear_session()
+            return "clear_session"
+        return None
+
+    return step
+
+
+def route_driver(image: bytes, clear_session_mb: float | None):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.v1.endpoints import soil
+    from app.core.dependencies import get_current_user, get_rate_limiter, get_repo
+    from app.db.models import User
+    from app.services.ml_service import get_ml_service
+
+    # Ничего не должно расти by design: без индекса, поиска дубликатов и с одним и тем же файлом
+    settings.SIMILARITY_INDEX_ENABLED = False
+    settings.DUPLICATE_DETECTION = "off"
+    settings.STORAGE_BACKEND = "local"
+    settings.STORAGE_LOCAL_ROOT = tempfile.mkdtemp(prefix="soak-")
+
+    class SoakRepo:
+        dashboard_cache = None
+
+        def __init__(self):
+            self.ids = itertools.count(1)
+
+        async def save_soil_analysis(self, analysis):
+            analysis.id = next(self.ids)
+            return analysis.id
+
+    class NoLimit:
+        async def check(self, *args, **kwargs):
+            pass
+
+    repo = SoakRepo()
+    user = User(id=1, username="soak", email="soak@example.com", hashed_password="-", is_verified=True)
+
+    app = FastAPI()
+    app.include_router(soil.router, prefix="/api/v1/soil")
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_repo] = lambda: repo
+    app.dependency_overrides[get_rate_limiter] = lambda: NoLimit()
+    client = TestClient(app)
+
+    def step():
+        response = client.post("/api/v1/soil/analyze", files={"file": ("soak.jpg", image, "image/jpeg")})
+        if response.status_code != 200:
+            raise RuntimeError(f"analyze returned {response.status_code}: {response.text}")
+        if clear_session_mb and rss_mb() > clear_session_mb:
+            get_ml_service().clear_session()
+            return "clear_session"
+        return None
+
+    return step
+
+
+def top_growth(baseline: tracemalloc.Snapshot, limit: int) -> list[dict]:
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [
+        {"where": str(stat.traceback), "size_diff_kb": stat.size_diff / 1024, "count_diff": stat.count_diff}
+        for stat in snapshot.compare_to(baseline, "lineno")[:limit]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test: RSS and Python allocations over many predictions")
+    parser.add_argument("--target", choices=["service", "route"], default="service")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--image", type=Path, default=None, help="image to send (default: synthetic 1280x960 JPEG)")
+    parser.add_argument("--max-growth-mb", type=float, default=100.0, help="fail if RSS grows more after warm-up")
+    parser.add_argument("--clear-session-mb", type=float, default=None, help="clear the Keras session over this RSS")
+    parser.add_argument("--top", type=int, default=10, help="allocators to report")
+    parser.add_argument("--output", type=Path, default=None, help="write timeline and allocators as JSON")
+    args = parser.parse_args()
+
+    image = args.image.read_bytes() if args.image else synthetic_jpeg()
+    driver = route_driver if args.target == "route" else service_driver
+    step = driver(image, args.clear_session_mb)
+
+    print("=" * 60)
+    print(f"MEMORY SOAK TEST ({args.target}, {args.iterations} iterations)")
+    print("=" * 60)
+
+    for _ in range(args.warmup):
+        step()
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    timeline = []
+    events = []
+
+    print(f"{'iteration':>10}{'rss MB':>10}{'traced MB':>11}{'sec':>8}")
+    for i in range(1, args.iterations + 1):
+        event = step()
+        if event:
+            events.append({"iteration": i, "event": event, "rss_mb": rss_mb()})
+        if i % args.sample_every == 0 or i == args.iterations:
+            point = {
+                "iteration": i,
+                "rss_mb": round(rss_mb(), 1),
+                "traced_mb": round(tracemalloc.get_traced_memory()[0] / 1024 / 1024, 2),
+                "elapsed_s": round(time.perf_counter() - started, 1),
+            }
+            timeline.append(point)
+            print(f"{i:>10}{point['rss_mb']:>10.1f}{point['traced_mb']:>11.2f}{point['elapsed_s']:>8.1f}")
+
+    allocators = top_growth(baseline, args.top)
+    tracemalloc.stop()
+
+    growth = timeline[-1]["rss_mb"] - baseline_rss
+    print(f"\nTop {args.top} Python allocators by growth since warm-up:")
+    for item in allocators:
+        print(f"  {item['size_diff_kb']:>+10.1f} KB {item['count_diff']:>+7} blocks  {item['where']}")
+    if events:
+        print(f"\nKeras session cleared {len(events)} times")
+    print(
+        f"\nRSS: {baseline_rss:.1f} -> {timeline[-1]['rss_mb']:.1f} MB ({growth:+.1f} MB, "
+        f"{growth / args.iterations * 1000:+.2f} MB per 1000 iterations), limit {args.max_growth_mb:.0f} MB"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "target": args.target,
+                "iterations": args.iterations,
+                "baseline_rss_mb": baseline_rss,
+                "rss_growth_mb": growth,
+                "timeline": timeline,
+                "events": events,
+                "allocators": allocators,
+            }, f, indent=2)
+
+    if growth > args.max_growth_mb:
+        print("FAIL: memory growth over the limit")
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
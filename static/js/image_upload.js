@@ -0,0 +1,83 @@
+// Уменьшение фото в браузере перед загрузкой
+//
+// Снимок с камеры (4-10 МБ) декодируется и пережимается на canvas до
+// UPLOAD_MAX_DIMENSION по длинной стороне в JPEG с качеством UPLOAD_JPEG_QUALITY.
+// Настройки приходят со страницы: window.UPLOAD_CONFIG (см. page_context).
+
+const ImageUpload = {
+    config() {
+        return Object.assign(
+            { maxDimension: 1280, jpegQuality: 0.85, acceptOriginal: true },
+            window.UPLOAD_CONFIG || {}
+        );
+    },
+
+    async decode(file) {
+        // createImageBitmap учитывает EXIF-ориентацию и не блокирует основной поток
+        if (window.createImageBitmap) {
+            try {
+                return await createImageBitmap(file, { imageOrientation: 'from-image' });
+            } catch (e) {
+                // Старые браузеры без options - ниже через <img>
+            }
+        }
+        const url = URL.createObjectURL(file);
+        try {
+            const img = new Image();
+            img.src = url;
+            await img.decode();
+            return img;
+        } finally {
+            URL.revokeObjectURL(url);
+        }
+    },
+
+    // Уменьшенная JPEG-копия файла; исходный файл, если уменьшать нечего или не получилось
+    async downscale(file) {
+        const { maxDimension, jpegQuality } = this.config();
+        if (!maxDimension) return file;
+
+        let image;
+        try {
+            image = await this.decode(file);
+        } catch (e) {
+            console.warn('Cannot decode image in browser, uploading as is:', e);
+            return file;
+        }
+
+        const width = image.width;
+        const height = image.height;
+        const scale = Math.min(1, maxDimension / Math.max(width, height));
+        if (scale === 1 && file.type === 'image/jpeg') {
+            if (image.close) image.close();
+            return file;
+        }
+
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(width * scale);
+        canvas.height = Math.round(height * scale);
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingQuality = 'high';
+        ctx.drawImage(image, 0, 0, canvas.width, canvas.height);
+        if (image.close) image.close();
+
+        const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', jpegQuality));
+        if (!blob || blob.size >= file.size) return file;
+
+        const name = file.name.replace(/\.[^.]+$/, '') + '.jpg';
+        return new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
+    },
+
+    // FormData для /api/v1/soil/analyze: уменьшенная копия и, по желанию пользователя, оригинал
+    async buildFormData(file, keepOriginal = false) {
+        const upload = await this.downscale(file);
+        const formData = new FormData();
+        formData.append('file', upload);
+        // Оригинал сервер примет только в JPEG/PNG
+        const originalAllowed = ['image/jpeg', 'image/png'].includes(file.type);
+        if (keepOriginal && this.config().acceptOriginal && originalAllowed && upload !== file) {
+            formData.append('original', file);
+        }
+        return formData;
+    }
+};
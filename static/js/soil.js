@@ -1,4 +1,5 @@
 // Soil analysis functionality
+// Requires image_upload.js (ImageUpload) on the page
 
 let selectedFile = null;
 
@@ -51,8 +52,9 @@ async function analyzeImage() {
     document.getElementById('analysisResult').style.display = 'none';
 
     try {
-        const formData = new FormData();
-        formData.append('file', selectedFile);
+        // Уменьшенная копия (image_upload.js); оригинал - если отмечен чекбокс keepOriginal
+        const keepOriginal = document.getElementById('keepOriginal');
+        const formData = await ImageUpload.buildFormData(selectedFile, keepOriginal ? keepOriginal.checked : false);
 
         const response = await fetch('/api/v1/soil/analyze', {
             method: 'POST',
@@ -1,9 +1,20 @@
 """
 Script to train CNN model for soil classification
+
+    python train_model.py                       # teacher: best_model.keras
+    python train_model.py --distill             # student distilled from best_model.keras
+    python train_model.py --distill teacher.keras --temperature 4 --alpha 0.3
+
+Distillation trains a small student on the teacher's softened outputs (plus
+the hard labels) and saves it as student_model.keras next to the same
+class_mapping.json, so it can be registered and served (or used as the
+fast model of the cascade) without code changes.
 """
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # Suppress TensorFlow warnings
 
+import argparse
+
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -18,6 +29,7 @@ IMG_WIDTH = 224
 BATCH_SIZE = 32
 EPOCHS = 30
 DATASET_PATH = Path("Dataset")
+SHARDS_PATH = Path("Dataset_shards")  # см. prepare_dataset.py
 MODEL_PATH = Path("app/ml_model")
 
 # Soil types and their descriptions
@@ -92,14 +104,201 @@ def create_model(num_classes):
     return model
 
 
-def main():
-    print("=" * 50)
-    print("SOIL CLASSIFICATION MODEL TRAINING")
-    print("=" * 50)
+def create_student_model(num_classes):
+    """Small CNN for distillation: depthwise-separable blocks, global pooling, narrow head"""
+    model = keras.Sequential([
+        layers.Input(shape=(IMG_HEIGHT, IMG_WIDTH, 3)),
 
-    # Create model directory
-    MODEL_PATH.mkdir(parents=True, exist_ok=True)
+        # Stem: stride 2 сразу уменьшает карту признаков в 4 раза
+        layers.Conv2D(16, (3, 3), strides=2, activation='relu'),
+        layers.BatchNormalization(),
+
+        layers.SeparableConv2D(32, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+
+        layers.SeparableConv2D(64, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+        layers.MaxPooling2D((2, 2)),
+
+        layers.SeparableConv2D(128, (3, 3), activation='relu'),
+        layers.BatchNormalization(),
+
+        # Global pooling вместо Flatten: голова не зависит от размера карты
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(64, activation='relu'),  # penultimate Dense: embedding for similarity search
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+    return model
+
+
+class Distiller(keras.Model):
+    """Trains the student on hard labels and the teacher's temperature-softened probabilities"""
+
+    def __init__(self, student, teacher, temperature=4.0, alpha=0.3):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.temperature = temperature
+        self.alpha = alpha  # вес жёстких меток; 1 - alpha - вес мягких целей учителя
+        self.kl_divergence = keras.losses.KLDivergence()
+
+    def call(self, x, training=False):
+        return self.student(x, training=training)
+
+    def soften(self, probabilities):
+        # softmax(log p / T) == softmax(logits / T): модели отдают вероятности, не логиты
+        return tf.nn.softmax(tf.math.log(probabilities + 1e-7) / self.temperature)
+
+    def compute_loss(self, x=None, y=None, y_pred=None, sample_weight=None, training=True):
+        teacher_pred = self.teacher(x, training=False)
+        hard_loss = tf.reduce_mean(keras.losses.categorical_crossentropy(y, y_pred))
+        # T^2 сохраняет масштаб градиентов мягкой части при изменении температуры
+        soft_loss = self.kl_divergence(self.soften(teacher_pred), self.soften(y_pred)) * self.temperature ** 2
+        return self.alpha * hard_loss + (1 - self.alpha) * soft_loss
+
+
+def estimate_flops(model):
+    """Multiply-add FLOPs (x2) of Conv2D / SeparableConv2D / Dense layers for one image"""
+    flops = 0
+    for layer in model.layers:
+        output_shape = layer.output.shape
+        if isinstance(layer, layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            in_channels = layer.input.shape[-1]
+            pixels = output_shape[1] * output_shape[2]
+            flops += 2 * pixels * (kh * kw * in_channels + in_channels * layer.filters)
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            in_channels = layer.input.shape[-1]
+            flops += 2 * output_shape[1] * output_shape[2] * kh * kw * in_channels * layer.filters
+        elif isinstance(layer, layers.Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return flops
+
+
+def distill(teacher_path, train_data, test_data, num_classes, temperature, alpha):
+    """Train a student against the teacher, save it and report both side by side"""
+    print(f"\nLoading teacher: {teacher_path}")
+    teacher = keras.models.load_model(teacher_path)
+
+    student = create_student_model(num_classes)
+    print(student.summary())
+
+    distiller = Distiller(student, teacher, temperature=temperature, alpha=alpha)
+    distiller.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        metrics=['accuracy']
+    )
+
+    callbacks = [
+        keras.callbacks.EarlyStopping(
+            monitor='val_accuracy',
+            patience=5,
+            restore_best_weights=True,
+            verbose=1
+        ),
+        keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=3,
+            min_lr=1e-7,
+            verbose=1
+        )
+    ]
+
+    print("\n" + "=" * 50)
+    print(f"STARTING DISTILLATION (T={temperature}, alpha={alpha})")
+    print("=" * 50 + "\n")
+
+    history = distiller.fit(
+        train_data,
+        epochs=EPOCHS,
+        validation_data=test_data,
+        callbacks=callbacks,
+        verbose=1
+    )
+
+    # Сохраняется только студент: обычная Sequential-модель, загружается SoilMLService как есть
+    student_file = MODEL_PATH / 'student_model.keras'
+    student.save(student_file)
+
+    print("\n" + "=" * 50)
+    print("TEACHER VS STUDENT")
+    print("=" * 50 + "\n")
+
+    report = {}
+    for name, model, path in (("teacher", teacher, Path(teacher_path)), ("student", student, student_file)):
+        model.compile(loss='categorical_crossentropy', metrics=['accuracy'])
+        test_loss, test_accuracy = model.evaluate(test_data, verbose=0)
+        report[name] = {
+            'test_accuracy': float(test_accuracy),
+            'test_loss': float(test_loss),
+            'params': int(model.count_params()),
+            'flops': int(estimate_flops(model)),
+            'size_bytes': path.stat().st_size,
+        }
+
+    print(f"{'':<10}{'accuracy':>10}{'params':>12}{'MFLOPs':>10}{'size MB':>10}")
+    for name, row in report.items():
+        print(
+            f"{name:<10}{row['test_accuracy'] * 100:>9.2f}%{row['params']:>12,}"
+            f"{row['flops'] / 1e6:>10.1f}{row['size_bytes'] / 1024 / 1024:>10.2f}"
+        )
+    teacher_row, student_row = report['teacher'], report['student']
+    print(
+        f"\nStudent keeps {student_row['test_accuracy'] / teacher_row['test_accuracy'] * 100:.1f}% of teacher accuracy "
+        f"with {student_row['flops'] / teacher_row['flops'] * 100:.1f}% of FLOPs "
+        f"and {student_row['size_bytes'] / teacher_row['size_bytes'] * 100:.1f}% of size"
+    )
+
+    history_dict = {
+        'accuracy': [float(x) for x in history.history['accuracy']],
+        'val_accuracy': [float(x) for x in history.history['val_accuracy']],
+        'loss': [float(x) for x in history.history['loss']],
+        'val_loss': [float(x) for x in history.history['val_loss']],
+        'temperature': temperature,
+        'alpha': alpha,
+        'report': report
+    }
+
+    with open(MODEL_PATH / 'student_history.json', 'w') as f:
+        json.dump(history_dict, f, indent=2)
+
+    print(f"\nStudent saved to: {student_file}")
+    print(f"Register it: python -m app.services.model_registry register <version> {student_file} {MODEL_PATH / 'class_mapping.json'}")
 
+
+def create_augmentation():
+    """Augmentation layers for the shard pipeline (close to the ImageDataGenerator setup, without shear)"""
+    return keras.Sequential([
+        layers.RandomFlip("horizontal_and_vertical"),
+        layers.RandomRotation(20 / 360, fill_mode='nearest'),
+        layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        layers.RandomZoom(0.2, fill_mode='nearest'),
+    ])
+
+
+def load_from_shards(shards_path):
+    """Train/test tf.data pipelines streamed from memory-mapped shards"""
+    from prepare_dataset import ShardedSplit
+
+    train_split = ShardedSplit(shards_path / 'Train')
+    test_split = ShardedSplit(shards_path / 'test')
+
+    train_data = train_split.to_tf_dataset(BATCH_SIZE, shuffle=True, augment=create_augmentation(), seed=42)
+    test_data = test_split.to_tf_dataset(BATCH_SIZE)
+
+    class_names = train_split.class_names
+    class_indices = {name: i for i, name in enumerate(class_names)}
+    return train_data, test_data, class_names, class_indices, len(train_split), len(test_split)
+
+
+def load_from_directory():
+    """Train/test generators decoding JPEGs from Dataset/ on every epoch"""
     # Data augmentation for training
     train_datagen = ImageDataGenerator(
         rescale=1./255,
@@ -136,19 +335,46 @@ def main():
         shuffle=False
     )
 
-    # Get class names
     class_names = list(train_generator.class_indices.keys())
+    return (train_generator, test_generator, class_names, train_generator.class_indices,
+            train_generator.samples, test_generator.samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train soil classification CNN")
+    parser.add_argument("--shards", type=Path, nargs="?", const=SHARDS_PATH, default=None,
+                        help=f"read preprocessed shards (default dir: {SHARDS_PATH}) instead of decoding JPEGs")
+    parser.add_argument("--distill", type=Path, nargs="?", const=MODEL_PATH / 'best_model.keras', default=None,
+                        help="train a small student from this teacher (default: best_model.keras)")
+    parser.add_argument("--temperature", type=float, default=4.0, help="distillation softmax temperature")
+    parser.add_argument("--alpha", type=float, default=0.3, help="weight of hard labels in the distillation loss")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("SOIL CLASSIFICATION MODEL TRAINING")
+    print("=" * 50)
+
+    # Create model directory
+    MODEL_PATH.mkdir(parents=True, exist_ok=True)
+
+    if args.shards:
+        print(f"\nLoading data from shards: {args.shards}")
+        train_data, test_data, class_names, class_indices, train_samples, test_samples = load_from_shards(args.shards)
+    else:
+        train_data, test_data, class_names, class_indices, train_samples, test_samples = load_from_directory()
+
+    # Get class names
     num_classes = len(class_names)
 
     print(f"\nClasses found: {class_names}")
     print(f"Number of classes: {num_classes}")
-    print(f"Training samples: {train_generator.samples}")
-    print(f"Test samples: {test_generator.samples}")
+    print(f"Training samples: {train_samples}")
+    print(f"Test samples: {test_samples}")
 
     # Save class names
     class_mapping = {
         'class_names': class_names,
-        'class_indices': train_generator.class_indices,
+        'class_indices': class_indices,
         'soil_info': SOIL_INFO
     }
 
@@ -157,6 +383,10 @@ def main():
 
     print("\nClass mapping saved!")
 
+    if args.distill:
+        distill(args.distill, train_data, test_data, num_classes, args.temperature, args.alpha)
+        return
+
     # Create model
     print("\nCreating model...")
     model = create_model(num_classes)
@@ -199,9 +429,9 @@ def main():
     print("=" * 50 + "\n")
 
     history = model.fit(
-        train_generator,
+        train_data,
         epochs=EPOCHS,
-        validation_data=test_generator,
+        validation_data=test_data,
         callbacks=callbacks,
         verbose=1
     )
@@ -211,7 +441,7 @@ def main():
     print("EVALUATING MODEL")
     print("=" * 50 + "\n")
 
-    test_loss, test_accuracy = model.evaluate(test_generator, verbose=1)
+    test_loss, test_accuracy = model.evaluate(test_data, verbose=1)
     print(f"\nTest Accuracy: {test_accuracy * 100:.2f}%")
     print(f"Test Loss: {test_loss:.4f}")
 